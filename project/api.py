@@ -1,230 +1,439 @@
-from flask import Flask, request, jsonify, send_from_directory
-import os
-import uuid
-import cv2
-import numpy as np
-import base64
-from verify import verify_id_image
-from otp import generate_otp, verify_otp, send_otp_email, send_security_alarm
-
-app = Flask(__name__)
-RESULTS_FOLDER = "results"
-os.makedirs(RESULTS_FOLDER, exist_ok=True)
-
-verifications = {}  # Temporary in-memory store
-
-
-@app.route("/verifications", methods=["POST"])
-def create_verification():
-    print("\nReceived POST request to /verifications")
-
-    if "image" not in request.files:
-        print("No image uploaded.")
-        return jsonify({"error": "No image uploaded"}), 400
-
-    file = request.files["image"]
-    img_array = np.frombuffer(file.read(), np.uint8)
-    frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
-
-    if frame is None:
-        print("Frame could not be decoded.")
-        return jsonify({"error": "Invalid image format"}), 400
-
-    print("Image successfully decoded. Running verify_id_image...")
-
-    try:
-        result_json, annotated_image, face_crop = verify_id_image(frame)
-    except Exception as e:
-        print(f"Error in verify_id_image: {e}")
-        return jsonify({"error": "Verification processing error"}), 500
-
-    if annotated_image is None or not isinstance(annotated_image, np.ndarray):
-        print("Invalid annotated image.")
-        return jsonify({"error": "Verification failed"}), 500
-
-    _, buffer = cv2.imencode(".jpg", annotated_image)
-    result_json["annotated_image_base64"] = base64.b64encode(buffer).decode("utf-8")
-
-    if result_json.get("all_labels_detected"):
-        verification_id = str(uuid.uuid4())
-        verification_folder = os.path.join(RESULTS_FOLDER, verification_id)
-        os.makedirs(verification_folder, exist_ok=True)
-
-        print(f"All labels detected. Saving to: {verification_folder}")
-
-        # Save files, result image, face crop and text result
-        cv2.imwrite(os.path.join(verification_folder, "annotated.jpg"), annotated_image)
-        if face_crop is not None:
-            cv2.imwrite(os.path.join(verification_folder, "face.jpg"), face_crop)
-            result_json["face_image_url"] = f"/verifications/{verification_id}/face"
-        else:
-            result_json["face_image_url"] = None
-
-        with open(os.path.join(verification_folder, "ocr.txt"), "w") as f:
-            f.write(f"ID Number: {result_json.get('id_number', 'N/A')}\n")
-            f.write(f"First Name: {result_json.get('first_name', 'N/A')}\n")
-            f.write(f"Last Name: {result_json.get('last_name', 'N/A')}\n")
-
-        with open(os.path.join(verification_folder, "log.txt"), "w") as f:
-            f.write(
-                f"Face Match Result: {result_json.get('face_match_result', 'N/A')}\n"
-            )
-            f.write(f"Logo Found: {result_json.get('logo_found', 'N/A')}\n")
-            f.write(f"Pattern Count: {result_json.get('pattern_count', 'N/A')}\n")
-            f.write(
-                f"All Labels Detected: {result_json.get('all_labels_detected', 'N/A')}\n"
-            )
-            if not result_json.get("all_labels_detected"):
-                f.write("Missing labels detected.\n")
-
-        # Update JSON with download URLs
-        result_json.update(
-            {
-                "id": verification_id,
-                "annotated_image_url": f"/verifications/{verification_id}/image",
-                "ocr_text_url": f"/verifications/{verification_id}/ocr.txt",
-                "debug_log_url": f"/verifications/{verification_id}/log.txt",
-            }
-        )
-
-        # Store in memory
-        verifications[verification_id] = result_json
-    else:
-        print("Not all labels detected. No save.")
-
-    print("Returning response.")
-    return jsonify(result_json), 201
-
-
-@app.route("/verifications/<verification_id>", methods=["GET"])
-def get_verification(verification_id):
-    print(f"\nGET request for verification ID: {verification_id}")
-    result = verifications.get(verification_id)
-    if not result:
-        print("Verification not found.")
-        return jsonify({"error": "Verification not found"}), 404
-    return jsonify(result)
-
-
-@app.route("/verifications/<verification_id>/<filename>", methods=["GET"])
-def get_verification_file(verification_id, filename):
-    folder = os.path.join(RESULTS_FOLDER, verification_id)
-    file_path = os.path.join(folder, filename)
-    if not os.path.exists(file_path):
-        print(f"File not found: {filename}")
-        return jsonify({"error": "File not found"}), 404
-    print(f"Serving file: {filename}")
-    return send_from_directory(folder, filename)
-
-
-@app.route("/otp/send", methods=["POST"])
-def send_otp():
-    """
-    Generate and send OTP to student email
-    """
-    data = request.get_json()
-    if not data or "student_id" not in data:
-        return jsonify({"success": False, "message": "Student ID is required"}), 400
-
-    student_id = data["student_id"]
-
-    # Validate student ID format (assuming 8 digits)
-    if not student_id.isdigit() or len(student_id) != 8:
-        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
-
-    # Generate OTP
-    otp_code = generate_otp(student_id)
-
-    # Send OTP via email
-    success, message = send_otp_email(student_id, otp_code)
-
-    if success:
-        return (
-            jsonify(
-                {
-                    "success": True,
-                    "message": "OTP sent successfully to your student email",
-                }
-            ),
-            200,
-        )
-    else:
-        return (
-            jsonify({"success": False, "message": f"Failed to send OTP: {message}"}),
-            500,
-        )
-
-
-@app.route("/otp/verify", methods=["POST"])
-def verify_otp_code():
-    """
-    Verify the OTP code provided by the student
-    """
-    data = request.get_json()
-    if not data or "student_id" not in data or "otp_code" not in data:
-        return (
-            jsonify(
-                {"success": False, "message": "Student ID and OTP code are required"}
-            ),
-            400,
-        )
-
-    student_id = data["student_id"]
-    otp_code = data["otp_code"]
-
-    # Validate student ID format
-    if not student_id.isdigit() or len(student_id) != 8:
-        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
-
-    # Validate OTP format (4 digits)
-    if not otp_code.isdigit() or len(otp_code) != 4:
-        return jsonify({"success": False, "message": "Invalid OTP format"}), 400
-
-    # Verify OTP
-    success, message = verify_otp(student_id, otp_code)
-
-    return jsonify({"success": success, "message": message}), 200 if success else 400
-
-
-@app.route("/security/alarm", methods=["POST"])
-def send_security_alarm_endpoint():
-    """
-    Send security alarm email for unauthorized access
-    """
-    data = request.get_json()
-    if not data or "student_id" not in data or "verification_id" not in data:
-        return (
-            jsonify(
-                {
-                    "success": False,
-                    "message": "Student ID and verification ID are required",
-                }
-            ),
-            400,
-        )
-
-    student_id = data["student_id"]
-    verification_id = data["verification_id"]
-
-    # Validate student ID format
-    if not student_id.isdigit() or len(student_id) != 8:
-        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
-
-    # Get the verification result
-    verification_result = verifications.get(verification_id)
-    if not verification_result:
-        return jsonify({"success": False, "message": "Verification not found"}), 404
-
-    # Get the path to the saved annotated image
-    img_path = os.path.join(RESULTS_FOLDER, verification_id, "annotated.jpg")
-    if not os.path.exists(img_path):
-        return jsonify({"success": False, "message": "Annotated image not found"}), 404
-
-    # Send security alarm with embedded image
-    success, message = send_security_alarm(student_id)
-
-    return jsonify({"success": success, "message": message}), 200 if success else 500
-
-
-if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True)
+from flask import Flask, Response, request, jsonify
+from werkzeug.wsgi import wrap_file
+import os
+import uuid
+import numpy as np
+import base64
+import atexit
+import mimetypes
+from batcher import InferenceBatcher
+from verify import gallery, registry
+from ocr import cache as ocr_cache
+from draw_utils import render_annotations
+from ingest import Upload
+from persistence import SAVED_JPEG_QUALITY, ArtifactWriter
+from store import (
+    ARTIFACT_ALIASES,
+    RESULTS_FOLDER,
+    BlobReader,
+    ResultCache,
+    VerificationStore,
+)
+from wire_format import (
+    JSON,
+    PREVIEW_JPEG_QUALITY,
+    PREVIEW_SCALE,
+    encode_body,
+    encode_preview,
+    supported_formats,
+)
+from otp import generate_otp, verify_otp, send_otp_email, send_security_alarm
+
+app = Flask(__name__)
+API_DEBUG = os.getenv("API_DEBUG", "0") == "1"
+# Saved verifications live in an indexed store under results/ and are
+# written off the request thread; routes that read their files wait this
+# long for a verification still in the queue. They are opened by start(),
+# not on import, because spawned inference workers import this module too.
+store = None
+result_cache = None
+artifacts = None
+ARTIFACT_WAIT_SECONDS = float(os.getenv("ARTIFACT_WAIT_SECONDS", "5"))
+# Saved artifacts never change, so clients may cache them for good
+ARTIFACT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ARTIFACT_CHUNK_SIZE = 64 * 1024
+
+# Concurrent requests share a bounded set of inference workers so the models
+# see batches instead of competing calls
+batcher = InferenceBatcher()
+
+
+def start():
+    """Open the verification store and start the inference workers"""
+    global store, result_cache, artifacts
+    if store is not None:
+        return
+    store = VerificationStore(RESULTS_FOLDER)
+    result_cache = ResultCache()
+    artifacts = ArtifactWriter(store)
+    atexit.register(artifacts.flush, 10)
+    # The inference workers load their models in the background so health
+    # and OTP routes are served straight away
+    batcher.start(warm_up=os.getenv("WARM_UP_MODELS", "1") == "1")
+
+
+@app.route("/verifications", methods=["POST"])
+def create_verification():
+    print("\nReceived POST request to /verifications")
+
+    if "image" not in request.files:
+        print("No image uploaded.")
+        return jsonify({"error": "No image uploaded"}), 400
+
+    # Large uploads are decoded at reduced scale; OCR still reads the text
+    # fields from the full-resolution image
+    file = request.files["image"]
+    upload = Upload(file.read())
+    frame = upload.frame
+
+    if frame is None:
+        print("Frame could not be decoded.")
+        return jsonify({"error": "Invalid image format"}), 400
+
+    # annotate=image (default) returns the annotated JPEG with every frame.
+    # annotate=data returns the boxes as JSON only and renders the image
+    # just for verifications that get saved.
+    annotate = request.form.get("annotate", request.args.get("annotate", "image"))
+    render = annotate != "data"
+
+    print("Image successfully decoded. Running verify_id_image...")
+
+    try:
+        result_json, annotated_image, face_crop = batcher.verify(
+            frame, request.form.get("session_id"), render, upload
+        )
+    except Exception as e:
+        print(f"Error in verify_id_image: {e}")
+        return jsonify({"error": "Verification processing error"}), 500
+
+    if render and (
+        annotated_image is None or not isinstance(annotated_image, np.ndarray)
+    ):
+        print("Invalid annotated image.")
+        return jsonify({"error": "Verification failed"}), 500
+
+    # Saved verifications keep the image and face crop at the upload's full
+    # resolution, so only they pay for decoding it; annotations and
+    # face_bbox are already in its coordinates
+    saved_image = annotated_image
+    if result_json.get("all_labels_detected") and (
+        upload.scale != 1 or annotated_image is None
+    ):
+        full_frame = upload.full_frame()
+        saved_image = render_annotations(full_frame, result_json["annotations"])
+        if result_json.get("face_bbox"):
+            x, y, w, h = result_json["face_bbox"]
+            face_crop = full_frame[y : y + h, x : x + w]
+        if annotated_image is None:
+            annotated_image = saved_image
+
+    # JSON clients get the preview as base64; msgpack and multipart clients
+    # (chosen through the Accept header) get the raw JPEG bytes
+    response_format = request.accept_mimetypes.best_match(supported_formats()) or JSON
+    preview_quality = request.form.get(
+        "preview_quality", PREVIEW_JPEG_QUALITY, type=int
+    )
+    preview_scale = request.form.get("preview_scale", PREVIEW_SCALE, type=float)
+    preview_full_size = not 0 < preview_scale < 1
+    preview_bytes = None
+    saved_bytes = None
+    if annotated_image is not None:
+        if (
+            result_json.get("all_labels_detected")
+            and saved_image is annotated_image
+            and preview_full_size
+        ):
+            # A saved frame is encoded once, at the saved quality, and those
+            # bytes are both the preview and annotated.jpg
+            saved_bytes = preview_bytes = encode_preview(
+                annotated_image, quality=SAVED_JPEG_QUALITY, scale=1
+            )
+        else:
+            preview_bytes = encode_preview(
+                annotated_image, quality=preview_quality, scale=preview_scale
+            )
+    if preview_bytes is not None and response_format == JSON:
+        result_json["annotated_image_base64"] = base64.b64encode(
+            preview_bytes
+        ).decode("utf-8")
+
+    if result_json.get("all_labels_detected"):
+        verification_id = str(uuid.uuid4())
+        print(f"All labels detected. Saving as: {verification_id}")
+
+        # The files are written (and annotated.jpg encoded, when it is not
+        # the preview) in the background
+        ocr_text = (
+            f"ID Number: {result_json.get('id_number', 'N/A')}\n"
+            f"First Name: {result_json.get('first_name', 'N/A')}\n"
+            f"Last Name: {result_json.get('last_name', 'N/A')}\n"
+        )
+        log_text = (
+            f"Face Match Result: {result_json.get('face_match_result', 'N/A')}\n"
+            f"Logo Found: {result_json.get('logo_found', 'N/A')}\n"
+            f"Pattern Count: {result_json.get('pattern_count', 'N/A')}\n"
+            f"All Labels Detected: {result_json.get('all_labels_detected', 'N/A')}\n"
+        )
+        files = {
+            "annotated.jpg": saved_bytes if saved_bytes is not None else saved_image,
+            "ocr.txt": ocr_text,
+            "log.txt": log_text,
+        }
+        if face_crop is not None:
+            files["face.jpg"] = face_crop
+            result_json["face_image_url"] = f"/verifications/{verification_id}/face"
+        else:
+            result_json["face_image_url"] = None
+
+        # Update JSON with download URLs
+        result_json.update(
+            {
+                "id": verification_id,
+                "annotated_image_url": f"/verifications/{verification_id}/image",
+                "ocr_text_url": f"/verifications/{verification_id}/ocr.txt",
+                "debug_log_url": f"/verifications/{verification_id}/log.txt",
+            }
+        )
+
+        # Cached in the shape the store returns without its preview
+        record = dict(result_json)
+        record.pop("annotated_image_base64", None)
+        result_cache.put(verification_id, record)
+        artifacts.submit(verification_id, record, files)
+    else:
+        print("Not all labels detected. No save.")
+
+    print("Returning response.")
+    body, content_type = encode_body(result_json, preview_bytes, response_format)
+    return Response(body, status=201, content_type=content_type)
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    """
+    Report model readiness, load times and memory use
+    """
+    ready = batcher.is_ready()
+    return (
+        jsonify(
+            {
+                "status": "ready" if ready else "loading",
+                # Worker processes keep their own registries
+                "models": registry.status() if batcher.pool == "thread" else None,
+                "inference": batcher.status(),
+                "persistence": artifacts.stats(),
+                "result_cache": result_cache.stats(),
+                "ocr_cache": ocr_cache.stats(),
+            }
+        ),
+        200,
+    )
+
+
+def load_verification(verification_id, include_preview=True):
+    """
+    A saved verification's record, including one still being written.
+    Records are cached without their preview, which is always read back
+    from the store, so the body does not depend on what is cached.
+    """
+    result = result_cache.get(verification_id)
+    if result is None:
+        result = artifacts.pending(verification_id) or store.get(
+            verification_id, include_preview=False
+        )
+        if result is None:
+            return None
+        result_cache.put(verification_id, result)
+    if not include_preview:
+        return result
+    artifacts.wait(verification_id, timeout=ARTIFACT_WAIT_SECONDS)
+    return store.with_preview(verification_id, result)
+
+
+@app.route("/verifications", methods=["GET"])
+def list_verifications():
+    """
+    Saved verifications for a student (?student_id=) and/or a time range
+    (?since=&until=, Unix seconds), newest first
+    """
+    results = store.find(
+        student_id=request.args.get("student_id"),
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+        limit=min(request.args.get("limit", 100, type=int), 1000),
+    )
+    return jsonify({"verifications": results})
+
+
+@app.route("/verifications/<verification_id>", methods=["GET"])
+def get_verification(verification_id):
+    print(f"\nGET request for verification ID: {verification_id}")
+    result = load_verification(verification_id)
+    if not result:
+        print("Verification not found.")
+        return jsonify({"error": "Verification not found"}), 404
+    return jsonify(result)
+
+
+@app.route("/verifications/<verification_id>/<filename>", methods=["GET"])
+def get_verification_file(verification_id, filename):
+    artifacts.wait(verification_id, timeout=ARTIFACT_WAIT_SECONDS)
+    location = store.locate(verification_id, filename)
+    if location is None:
+        print(f"File not found: {filename}")
+        return jsonify({"error": "File not found"}), 404
+    name = ARTIFACT_ALIASES.get(filename, filename)
+    return send_artifact(location, name)
+
+
+def send_artifact(location, name):
+    """
+    Serve a stored artifact with a strong ETag, 304 for a matching
+    If-None-Match, single byte ranges (a multi-range request gets the
+    whole body), and the file handed to the server's wsgi.file_wrapper so
+    it can use sendfile
+    """
+    headers = {
+        "ETag": f'"{location.etag}"',
+        "Cache-Control": ARTIFACT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if request.if_none_match.contains_weak(location.etag):
+        return Response(status=304, headers=headers)
+
+    length = location.length
+    start, stop, status = 0, length, 200
+    if_range = request.if_range
+    if (
+        request.range is not None
+        and len(request.range.ranges) == 1
+        and (
+            (if_range.etag is None and if_range.date is None)
+            or if_range.etag == location.etag
+        )
+    ):
+        byte_range = request.range.range_for_length(length)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{length}"
+            return Response(status=416, headers=headers)
+        start, stop = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{length}"
+
+    mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    reader = BlobReader(location, start, stop - start)
+    response = Response(
+        wrap_file(request.environ, reader, ARTIFACT_CHUNK_SIZE),
+        status=status,
+        mimetype=mimetype,
+        headers=headers,
+        direct_passthrough=True,
+    )
+    response.content_length = stop - start
+    return response
+
+
+@app.route("/otp/send", methods=["POST"])
+def send_otp():
+    """
+    Generate and send OTP to student email
+    """
+    data = request.get_json()
+    if not data or "student_id" not in data:
+        return jsonify({"success": False, "message": "Student ID is required"}), 400
+
+    student_id = data["student_id"]
+
+    # Validate student ID format (assuming 8 digits)
+    if not student_id.isdigit() or len(student_id) != 8:
+        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
+
+    # Generate OTP
+    otp_code = generate_otp(student_id)
+
+    # Send OTP via email
+    success, message = send_otp_email(student_id, otp_code)
+
+    if success:
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": "OTP sent successfully to your student email",
+                }
+            ),
+            200,
+        )
+    else:
+        return (
+            jsonify({"success": False, "message": f"Failed to send OTP: {message}"}),
+            500,
+        )
+
+
+@app.route("/otp/verify", methods=["POST"])
+def verify_otp_code():
+    """
+    Verify the OTP code provided by the student
+    """
+    data = request.get_json()
+    if not data or "student_id" not in data or "otp_code" not in data:
+        return (
+            jsonify(
+                {"success": False, "message": "Student ID and OTP code are required"}
+            ),
+            400,
+        )
+
+    student_id = data["student_id"]
+    otp_code = data["otp_code"]
+
+    # Validate student ID format
+    if not student_id.isdigit() or len(student_id) != 8:
+        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
+
+    # Validate OTP format (4 digits)
+    if not otp_code.isdigit() or len(otp_code) != 4:
+        return jsonify({"success": False, "message": "Invalid OTP format"}), 400
+
+    # Verify OTP, then enrol the face proposed by the student's verification
+    success, message = verify_otp(student_id, otp_code)
+    if success:
+        gallery.confirm(student_id)
+
+    return jsonify({"success": success, "message": message}), 200 if success else 400
+
+
+@app.route("/security/alarm", methods=["POST"])
+def send_security_alarm_endpoint():
+    """
+    Send security alarm email for unauthorized access
+    """
+    data = request.get_json()
+    if not data or "student_id" not in data or "verification_id" not in data:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "message": "Student ID and verification ID are required",
+                }
+            ),
+            400,
+        )
+
+    student_id = data["student_id"]
+    verification_id = data["verification_id"]
+
+    # Validate student ID format
+    if not student_id.isdigit() or len(student_id) != 8:
+        return jsonify({"success": False, "message": "Invalid student ID format"}), 400
+
+    # Get the verification result
+    verification_result = load_verification(verification_id, include_preview=False)
+    if not verification_result:
+        return jsonify({"success": False, "message": "Verification not found"}), 404
+
+    # Check the annotated image was saved
+    artifacts.wait(verification_id, timeout=ARTIFACT_WAIT_SECONDS)
+    if store.locate(verification_id, "annotated.jpg") is None:
+        return jsonify({"success": False, "message": "Annotated image not found"}), 404
+
+    # Send security alarm with embedded image
+    success, message = send_security_alarm(student_id)
+
+    return jsonify({"success": success, "message": message}), 200 if success else 500
+
+
+if __name__ == "__main__":
+    start()
+    app.run(host="0.0.0.0", port=5000, debug=API_DEBUG, threaded=True)
@@ -0,0 +1,197 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from verify import gallery, registry, verify_id_images, warm_up_models
+from workers import WorkerPool
+
+# Requests arriving within this window of each other are run as one batch
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+
+# Where batches run: "thread" runs them on worker threads in this process,
+# "process" hands them to worker processes with their own models (see
+# workers.py). INFERENCE_WORKERS bounds how many batches run at once.
+INFERENCE_POOL = os.getenv("INFERENCE_POOL", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+
+
+class _Lane:
+    """A queue of frames and the batching state of whoever drains it"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.last_arrival = 0.0
+        self.collect_lock = threading.Lock()
+        self.busy = 0
+
+
+class InferenceBatcher:
+    """
+    Collects frames from concurrent requests into micro-batches and runs each
+    batch through verify_id_images on a fixed number of inference workers.
+
+    A frame that arrives while the server is idle is dispatched straight away;
+    the batching window is only waited out when requests are arriving close
+    together, so light traffic does not pay for it. While every worker is
+    busy, new frames queue up and go out together in the next batch.
+
+    Worker threads share one queue. Worker processes each get their own,
+    and frames from a session always go to the same process so its motion
+    gate keeps working; frames without a session go to the shortest queue.
+    """
+
+    def __init__(
+        self,
+        window_ms=BATCH_WINDOW_MS,
+        max_batch_size=BATCH_MAX_SIZE,
+        run_batch=verify_id_images,
+        pool=INFERENCE_POOL,
+        workers=INFERENCE_WORKERS,
+    ):
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Unknown inference pool: {pool}")
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.run_batch = run_batch
+        self.pool = pool
+        self.workers = max(1, workers)
+        self._lanes = [_Lane() for _ in range(self.workers if pool == "process" else 1)]
+        self._start_lock = threading.Lock()
+        self._busy_lock = threading.Lock()
+        self._threads = []
+        self._processes = None
+
+    def start(self, warm_up=False):
+        """
+        Start the inference workers. With warm_up, every worker loads its
+        models before taking its first batch.
+        """
+        with self._start_lock:
+            if self._threads:
+                return
+            if self.pool == "process":
+                self._processes = WorkerPool(self.workers)
+                self._processes.start(warm_up)
+            for i in range(self.workers):
+                lane = i if self.pool == "process" else 0
+                thread = threading.Thread(
+                    target=self._dispatch_loop,
+                    args=(i, self._lanes[lane], warm_up and self.pool == "thread"),
+                    name=f"inference-worker-{i}",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def is_ready(self):
+        if self._processes is not None:
+            return self._processes.is_ready()
+        return registry.is_ready()
+
+    def status(self):
+        return {
+            "pool": self.pool,
+            "workers": self.workers,
+            "busy": sum(lane.busy for lane in self._lanes),
+            "queued": sum(lane.queue.qsize() for lane in self._lanes),
+        }
+
+    def submit(self, frame, session_id=None, render=True, source=None):
+        """Queue a frame and return a Future for its verify_id_image result"""
+        if not self._threads:
+            self.start()
+        future = Future()
+        self._lane_for(session_id).queue.put(
+            (frame, session_id, render, source, future, time.monotonic())
+        )
+        return future
+
+    def verify(self, frame, session_id=None, render=True, source=None):
+        """Blocking helper with the same return value as verify_id_image"""
+        return self.submit(frame, session_id, render, source).result()
+
+    def _lane_for(self, session_id):
+        if len(self._lanes) == 1:
+            return self._lanes[0]
+        index = self._processes.worker_for(session_id)
+        if index is not None:
+            return self._lanes[index]
+        return min(self._lanes, key=lambda lane: lane.queue.qsize() + lane.busy)
+
+    def _collect_batch(self, lane):
+        first = lane.queue.get()
+        batch = [first]
+        arrived = first[-1]
+        busy = arrived - lane.last_arrival < self.window
+        lane.last_arrival = arrived
+
+        deadline = arrived + self.window
+        while len(batch) < self.max_batch_size:
+            try:
+                if busy:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    item = lane.queue.get(timeout=timeout)
+                else:
+                    item = lane.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            lane.last_arrival = item[-1]
+        return batch
+
+    def _run(self, index, frames, session_ids, render, sources):
+        if self._processes is None:
+            return self.run_batch(frames, session_ids, render, sources)
+        results, proposals = self._processes.run(
+            index, frames, session_ids, render, sources
+        )
+        # Worker processes only read the gallery; this process holds their
+        # proposed enrolments until the OTP step confirms them
+        for id_number, embedding in proposals:
+            gallery.propose(id_number, embedding)
+        return results
+
+    def _dispatch_loop(self, index, lane, warm_up):
+        if warm_up:
+            warm_up_models()
+        while True:
+            # One worker collects at a time; the others wait their turn, so
+            # frames that arrive meanwhile end up in the same batch
+            with lane.collect_lock:
+                batch = self._collect_batch(lane)
+            frames, session_ids, render, sources, futures, _ = map(
+                list, zip(*batch)
+            )
+            with self._busy_lock:
+                lane.busy += 1
+            try:
+                results = self._run(index, frames, session_ids, render, sources)
+            except Exception as e:
+                print(f"Error in batched verification: {e}")
+                if len(batch) == 1:
+                    futures[0].set_exception(e)
+                else:
+                    self._run_each(index, batch)
+                continue
+            finally:
+                with self._busy_lock:
+                    lane.busy -= 1
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def _run_each(self, index, batch):
+        # Rerun a failed batch one frame at a time, so only the request
+        # whose frame raised gets the error
+        for frame, session_id, render, source, future, _ in batch:
+            try:
+                results = self._run(index, [frame], [session_id], [render], [source])
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(results[0])
@@ -0,0 +1,194 @@
+import argparse
+import glob
+import os
+import time
+
+# pytorch | onnx | openvino | openvino-int8
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "pytorch")
+DETECTOR_WEIGHTS = "models/best.pt"
+DETECTOR_IMGSZ = 320
+DETECTOR_DATA = os.path.join("..", "training model", "config.yaml")
+
+# Where ultralytics writes each export, relative to the .pt file
+EXPORT_SUFFIXES = {
+    "pytorch": ".pt",
+    "onnx": ".onnx",
+    "openvino": "_openvino_model",
+    "openvino-int8": "_int8_openvino_model",
+}
+
+# Classes that must be found reliably for a verification to pass
+KEY_CLASSES = {5: "unique_pattern", 6: "id_logo"}
+
+
+def backend_path(backend, weights=DETECTOR_WEIGHTS):
+    if backend not in EXPORT_SUFFIXES:
+        raise ValueError(f"Unknown detector backend: {backend}")
+    return os.path.splitext(weights)[0] + EXPORT_SUFFIXES[backend]
+
+
+def find_trained_weights():
+    """Return the best.pt of the most recent runs/detect/train* run, if any"""
+    candidates = glob.glob(
+        os.path.join("..", "runs", "detect", "train*", "weights", "best.pt")
+    )
+    if not candidates:
+        return None
+    return max(candidates, key=os.path.getmtime)
+
+
+def default_weights():
+    """models/best.pt, else the latest training run's best.pt"""
+    if os.path.exists(DETECTOR_WEIGHTS):
+        return DETECTOR_WEIGHTS
+    return find_trained_weights()
+
+
+def load_detector(backend=DETECTOR_BACKEND, weights=None):
+    """Load a backend's model, found next to the same weights export used"""
+    from ultralytics import YOLO
+
+    weights = weights or default_weights() or DETECTOR_WEIGHTS
+    path = backend_path(backend, weights)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"No {backend} export at {path}. Run: python detector.py export"
+        )
+    return YOLO(path, task="detect")
+
+
+def export_detector(weights=DETECTOR_WEIGHTS, data=DETECTOR_DATA, int8=True):
+    """Export the trained weights to ONNX and OpenVINO (optionally INT8)"""
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    # Dynamic batch so verify_id_images can send whole batches to the export
+    model.export(format="onnx", imgsz=DETECTOR_IMGSZ, dynamic=True)
+    model.export(format="openvino", imgsz=DETECTOR_IMGSZ, dynamic=True)
+    if int8:
+        # INT8 calibration runs over the dataset described by data
+        model.export(format="openvino", imgsz=DETECTOR_IMGSZ, int8=True, data=data)
+
+
+def _validation_images(data):
+    import yaml
+
+    with open(data) as f:
+        config = yaml.safe_load(f)
+    val_dir = os.path.join(config.get("path", ""), config["val"])
+    return sorted(glob.glob(os.path.join(val_dir, "*.jpg")))
+
+
+def _wall_clock_latency(model, images, runs=3):
+    # Warm-up pass so lazy initialisation is not counted
+    options = {"imgsz": DETECTOR_IMGSZ, "conf": 0.5, "device": "cpu", "verbose": False}
+    model(images[0], **options)
+    start = time.perf_counter()
+    for _ in range(runs):
+        for image in images:
+            model(image, **options)
+    return (time.perf_counter() - start) / (runs * len(images))
+
+
+def benchmark(backends, weights=DETECTOR_WEIGHTS, data=DETECTOR_DATA, samples=20):
+    """
+    Validate each available backend on the validation split and time
+    single-image CPU inference. Returns one row per backend.
+    """
+    rows = []
+    for backend in backends:
+        path = backend_path(backend, weights)
+        if not os.path.exists(path):
+            print(f"Skipping {backend}: {path} not found")
+            continue
+
+        model = load_detector(backend, weights)
+        metrics = model.val(
+            data=data,
+            imgsz=DETECTOR_IMGSZ,
+            batch=1,
+            device="cpu",
+            split="val",
+            plots=False,
+            verbose=False,
+        )
+
+        row = {
+            "backend": backend,
+            "mAP50": float(metrics.box.map50),
+            "val_inference_ms": float(metrics.speed["inference"]),
+        }
+        ap_classes = list(metrics.ap_class_index)
+        for cls, name in KEY_CLASSES.items():
+            if cls in ap_classes:
+                _, _, ap50, _ = metrics.box.class_result(ap_classes.index(cls))
+                row[f"AP50_{name}"] = float(ap50)
+            else:
+                row[f"AP50_{name}"] = None
+
+        val_images = _validation_images(data)[:samples]
+        if val_images:
+            row["latency_ms"] = _wall_clock_latency(model, val_images) * 1000
+        rows.append(row)
+    return rows
+
+
+def _print_table(rows):
+    if not rows:
+        print("Nothing to report.")
+        return
+    columns = list(rows[0])
+    print(" | ".join(f"{column:>22}" for column in columns))
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column)
+            if isinstance(value, float):
+                cells.append(f"{value:>22.3f}")
+            else:
+                cells.append(f"{str(value):>22}")
+        print(" | ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="YOLO detector exports and benchmark"
+    )
+    parser.add_argument(
+        "--weights",
+        default=None,
+        help="PyTorch weights (default: models/best.pt, else latest runs/detect)",
+    )
+    parser.add_argument("--data", default=DETECTOR_DATA, help="Dataset config yaml")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export ONNX/OpenVINO models"
+    )
+    export_parser.add_argument("--no-int8", action="store_true")
+
+    bench_parser = subparsers.add_parser(
+        "benchmark", help="Report CPU latency next to mAP50 for each backend"
+    )
+    bench_parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=list(EXPORT_SUFFIXES),
+        help="Backends to test",
+    )
+    bench_parser.add_argument("--samples", type=int, default=20)
+
+    args = parser.parse_args()
+    weights = args.weights or default_weights()
+    if weights is None:
+        print("No trained weights found.")
+        return
+
+    if args.command == "export":
+        export_detector(weights, args.data, int8=not args.no_int8)
+    else:
+        _print_table(benchmark(args.backends, weights, args.data, args.samples))
+
+
+if __name__ == "__main__":
+    main()
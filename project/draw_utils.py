@@ -16,3 +16,46 @@ def draw_bounding_box(image, bbox, label, color):
     x, y, w, h = bbox
     cv2.rectangle(image, (x, y), (x + w, y + h), color, 2)
     cv2.putText(image, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+
+def box_annotation(bbox, label, color, cls=None):
+    """Describe a labelled box as JSON-friendly data instead of drawing it"""
+    x, y, w, h = bbox
+    return {
+        "type": "box",
+        "class": None if cls is None else int(cls),
+        "box": [int(x), int(y), int(w), int(h)],
+        "label": label,
+        "color": [int(c) for c in color],
+    }
+
+
+def text_annotation(text, position, color, scale=0.7, thickness=2):
+    return {
+        "type": "text",
+        "text": text,
+        "position": [int(position[0]), int(position[1])],
+        "color": [int(c) for c in color],
+        "scale": scale,
+        "thickness": thickness,
+    }
+
+
+def render_annotations(image, annotations):
+    """Draw box/text annotations on a copy of the image"""
+    canvas = image.copy()
+    for annotation in annotations:
+        color = tuple(annotation["color"])
+        if annotation["type"] == "box":
+            draw_bounding_box(canvas, annotation["box"], annotation["label"], color)
+        elif annotation["type"] == "text":
+            cv2.putText(
+                canvas,
+                annotation["text"],
+                tuple(annotation["position"]),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                annotation["scale"],
+                color,
+                annotation["thickness"],
+            )
+    return canvas
@@ -0,0 +1,247 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# torch | onnx | onnx-int8
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_PATH = "models/facenet.onnx"
+ONNX_INT8_MODEL_PATH = "models/facenet.int8.onnx"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 lets onnxruntime decide
+
+
+def load_torch_facenet(device="cpu"):
+    from facenet_pytorch import InceptionResnetV1
+
+    return InceptionResnetV1(pretrained="vggface2").eval().to(device)
+
+
+def _temporary_path(path):
+    # Models are written under a per-process name and renamed into place, so
+    # worker processes exporting at the same time never load a partial file
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}.tmp{ext}"
+
+
+def export_onnx(facenet, path=ONNX_MODEL_PATH):
+    """Export the PyTorch FaceNet to ONNX with a dynamic batch dimension"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    facenet = facenet.cpu().eval()
+    dummy = torch.zeros(1, 3, 160, 160)
+    tmp_path = _temporary_path(path)
+    torch.onnx.export(
+        facenet,
+        dummy,
+        tmp_path,
+        input_names=["faces"],
+        output_names=["embeddings"],
+        dynamic_axes={"faces": {0: "batch"}, "embeddings": {0: "batch"}},
+        opset_version=17,
+    )
+    os.replace(tmp_path, path)
+    print(f"Exported FaceNet to {path}")
+    return path
+
+
+def quantize_onnx(src=ONNX_MODEL_PATH, dst=ONNX_INT8_MODEL_PATH):
+    """Write a dynamically quantized INT8 copy of an exported model"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = _temporary_path(dst)
+    quantize_dynamic(src, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, dst)
+    print(f"Quantized {src} to {dst}")
+    return dst
+
+
+class OnnxEmbedder:
+    """
+    Drop-in replacement for the PyTorch FaceNet module: takes the same
+    (N, 3, 160, 160) tensor and returns an (N, 512) tensor
+    """
+
+    def __init__(self, path, threads=ONNX_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, face_tensor):
+        faces = face_tensor.detach().cpu().numpy().astype(np.float32)
+        (embeddings,) = self.session.run(None, {self.input_name: faces})
+        return torch.from_numpy(embeddings)
+
+
+def load_embedder(backend=EMBEDDING_BACKEND, device="cpu"):
+    """
+    Load the embedder for the selected backend. ONNX models are exported
+    (and quantized) from the PyTorch weights the first time they are needed.
+    """
+    if backend == "torch":
+        return load_torch_facenet(device)
+
+    if backend not in ("onnx", "onnx-int8"):
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    if not os.path.exists(ONNX_MODEL_PATH):
+        export_onnx(load_torch_facenet("cpu"))
+    if backend == "onnx":
+        return OnnxEmbedder(ONNX_MODEL_PATH)
+
+    if not os.path.exists(ONNX_INT8_MODEL_PATH):
+        quantize_onnx()
+    return OnnxEmbedder(ONNX_INT8_MODEL_PATH)
+
+
+def _timed_embed(embedder, faces):
+    start = time.perf_counter()
+    with torch.no_grad():
+        embeddings = embedder(faces)
+    return embeddings.cpu(), (time.perf_counter() - start) / len(faces)
+
+
+def check_parity(reference, candidate, faces, threshold):
+    """
+    Compare a candidate embedder against the PyTorch reference on a batch of
+    face tensors. Reports how close the embeddings are and how many face
+    pairs would get a different match decision at the given threshold.
+    """
+    ref, ref_latency = _timed_embed(reference, faces)
+    cand, cand_latency = _timed_embed(candidate, faces)
+
+    self_similarity = F.cosine_similarity(ref, cand)
+    report = {
+        "faces": len(faces),
+        "min_cosine_to_reference": self_similarity.min().item(),
+        "mean_cosine_to_reference": self_similarity.mean().item(),
+        "reference_ms_per_face": ref_latency * 1000,
+        "candidate_ms_per_face": cand_latency * 1000,
+        "pairs": 0,
+        "decision_flips": 0,
+        "max_similarity_delta": 0.0,
+    }
+
+    if len(faces) >= 2:
+        ref_norm = F.normalize(ref, dim=1)
+        cand_norm = F.normalize(cand, dim=1)
+        ref_pairs = ref_norm @ ref_norm.T
+        cand_pairs = cand_norm @ cand_norm.T
+        upper = torch.triu_indices(len(faces), len(faces), offset=1)
+        ref_pairs = ref_pairs[upper[0], upper[1]]
+        cand_pairs = cand_pairs[upper[0], upper[1]]
+        flips = (ref_pairs > threshold) != (cand_pairs > threshold)
+        report.update(
+            {
+                "pairs": len(ref_pairs),
+                "decision_flips": int(flips.sum().item()),
+                "max_similarity_delta": (ref_pairs - cand_pairs).abs().max().item(),
+            }
+        )
+
+    return report
+
+
+def _saved_face_images(limit):
+    """(name, encoded face.jpg) of the latest saved verifications"""
+    from store import RESULTS_FOLDER, VerificationStore
+
+    store = VerificationStore(RESULTS_FOLDER)
+    for record in store.find(limit=limit):
+        data = store.read(record["id"], "face.jpg") if "id" in record else None
+        if data is not None:
+            yield record["id"], data
+    # Verifications saved before the store, one folder per id
+    for path in sorted(glob.glob(os.path.join(RESULTS_FOLDER, "*", "face.jpg"))):
+        with open(path, "rb") as f:
+            yield path, f.read()
+
+
+def _file_images(paths):
+    for path in paths:
+        with open(path, "rb") as f:
+            yield path, f.read()
+
+
+def _load_faces(images):
+    import cv2
+    from verify import extract_face
+
+    tensors = []
+    for name, data in images:
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            print(f"Skipping unreadable image: {name}")
+            continue
+        h, w = image.shape[:2]
+        tensor = extract_face(image, (0, 0, w, h))
+        if tensor is not None:
+            tensors.append(tensor.cpu())
+    return torch.cat(tensors) if tensors else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FaceNet ONNX export and parity check")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Export (and quantize) FaceNet"
+    )
+    export_parser.add_argument("--int8", action="store_true")
+
+    parity_parser = subparsers.add_parser(
+        "parity", help="Compare ONNX backends against PyTorch"
+    )
+    parity_parser.add_argument(
+        "images",
+        nargs="*",
+        help="Face crops to compare (default: face.jpg of saved verifications)",
+    )
+    parity_parser.add_argument(
+        "--limit",
+        type=int,
+        default=200,
+        help="How many of the latest saved verifications to read by default",
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx(load_torch_facenet("cpu"))
+        if args.int8:
+            quantize_onnx()
+        return
+
+    from verify import FACE_MATCH_THRESHOLD
+
+    if args.images:
+        images = _file_images(args.images)
+    else:
+        images = _saved_face_images(args.limit)
+    faces = _load_faces(images)
+    if faces is None:
+        print("No usable face images found.")
+        return
+
+    reference = load_torch_facenet("cpu")
+    for backend in ("onnx", "onnx-int8"):
+        report = check_parity(
+            reference, load_embedder(backend), faces, FACE_MATCH_THRESHOLD
+        )
+        print(f"\n{backend} vs torch (threshold {FACE_MATCH_THRESHOLD}):")
+        for key, value in report.items():
+            print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,196 +1,414 @@
+import argparse
+import atexit
+import contextlib
+import io
+import json
 import os
+import queue
+import shutil
+import threading
+import time
+import uuid
 from datetime import datetime
-from openpyxl import Workbook, load_workbook
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill, Font
 from openpyxl.utils import get_column_letter
 from openpyxl.drawing.image import Image as XLImage
-import cv2
-from PIL import Image
-import io
-
+from thumbnails import service as thumbnails
+
+LOG_DIR = os.getenv("VERIFICATION_LOG_DIR", "verification_log")
+# In asynchronous mode log calls only queue the row; a writer thread saves
+# queued rows together, waiting up to LOG_FLUSH_INTERVAL seconds to group them
+LOG_ASYNC = os.getenv("LOG_ASYNC", "1") == "1"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "256"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "64"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+# The journal and its workbook are split into shards: a new one starts each
+# day and whenever the live one reaches LOG_SHARD_MAX_ROWS rows or
+# LOG_SHARD_MAX_MB of journal and thumbnails (0 turns a limit off)
+LOG_SHARD_BY_DAY = os.getenv("LOG_SHARD_BY_DAY", "1") == "1"
+LOG_SHARD_MAX_ROWS = int(os.getenv("LOG_SHARD_MAX_ROWS", "1000"))
+LOG_SHARD_MAX_MB = float(os.getenv("LOG_SHARD_MAX_MB", "50"))
+# A manifest lock older than this is taken to be left by a crashed process
+MANIFEST_LOCK_TIMEOUT = 10  # seconds
 
 # For the project, we only want to save date,labels and ust image annotation into the excel file
 # for the failed_verification excel file, there will be 1 additional column that mentioned
 # the reason it failed
+SUCCESS_SHEET = {
+    "title": "Verifications",
+    "color": "00B050",
+    "headers": [
+        "Timestamp",
+        "Student ID",
+        "First Name",
+        "Last Name",
+        "Face Match",
+        "Logo Found",
+        "Pattern Count",
+        "OTP Verified",
+        "Annotated Image",
+    ],
+    # Make the image column wider
+    "widths": {9: 35},
+}
+FAILURE_SHEET = {
+    "title": "Failed Verifications",
+    "color": "FF0000",
+    "headers": [
+        "Timestamp",
+        "Student ID",
+        "First Name",
+        "Last Name",
+        "Face Match",
+        "Logo Found",
+        "Pattern Count",
+        "Failure Reasons",
+        "Annotated Image",
+    ],
+    # Make the Failure Reasons and image columns wider
+    "widths": {8: 40, 9: 35},
+}
+SHEETS = {"successful": SUCCESS_SHEET, "failed": FAILURE_SHEET}
+
+
+@contextlib.contextmanager
+def _file_lock(path, timeout=MANIFEST_LOCK_TIMEOUT):
+    """Lock file shared by every process using the log folder"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                print(f"Removing stale lock {path}")
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                deadline = time.monotonic() + timeout
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def _merge_shard(shard, saved):
+    # The logger owns the row counts and closing; the export CLI owns the
+    # exported and archived flags. Counts only grow, so keep the larger.
+    for key in ("rows", "bytes", "exported_rows"):
+        shard[key] = max(shard[key], saved.get(key, 0))
+    shard["closed"] = shard["closed"] or saved.get("closed", False)
+    if saved.get("archived") and not shard.get("archived"):
+        shard["archived"] = saved["archived"]
+
+
 class VerificationLogger:
-    def __init__(self):
+    """
+    Logging a verification appends one line to a JSONL journal and writes
+    its thumbnail to its own file, so the cost does not grow with the log.
+    export() builds the Excel workbooks from the journals in one pass.
+
+    Journals are sharded by day and size. manifest.json lists every shard
+    with its kind (successful/failed), day, row count and files; a shard
+    is its journal, its thumbnail folder and its workbook, so closed shards
+    can be exported or archived without touching the live one.
+
+    With asynchronous=True the thumbnail and journal writes happen on a
+    background thread, so logging from the Tk main thread returns at once.
+    Call close() (or flush()) before exiting so queued rows are saved.
+    """
+
+    def __init__(
+        self,
+        log_dir=LOG_DIR,
+        asynchronous=LOG_ASYNC,
+        queue_size=LOG_QUEUE_SIZE,
+        batch_size=LOG_BATCH_SIZE,
+        flush_interval=LOG_FLUSH_INTERVAL,
+        shard_by_day=LOG_SHARD_BY_DAY,
+        shard_max_rows=LOG_SHARD_MAX_ROWS,
+        shard_max_mb=LOG_SHARD_MAX_MB,
+    ):
         self.success_file = "successful_verifications.xlsx"
         self.failure_file = "failed_verifications.xlsx"
         self.max_image_height = 180  # Maximum height for Excel images
         self.max_image_width = 240  # Maximum width for Excel images
 
-        # Create success file if it doesn't exist
-        if not os.path.exists(self.success_file):
-            self._create_success_file()
-
-        # Create failure file if it doesn't exist
-        if not os.path.exists(self.failure_file):
-            self._create_failure_file()
-
-    def _create_success_file(self):
-        """Create the successful verifications Excel file with headers"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Verifications"
-
-        # Define headers
-        headers = [
-            "Timestamp",
-            "Student ID",
-            "First Name",
-            "Last Name",
-            "Face Match",
-            "Logo Found",
-            "Pattern Count",
-            "OTP Verified",
-            "Annotated Image",
-        ]
-
-        # Add headers with styling
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="00B050", end_color="00B050", fill_type="solid"
+        self.log_dir = log_dir
+        self.manifest_path = os.path.join(log_dir, "manifest.json")
+        self.shard_by_day = shard_by_day
+        self.shard_max_rows = shard_max_rows
+        self.shard_max_bytes = int(shard_max_mb * 1024 * 1024)
+        self._shard_lock = threading.RLock()
+        os.makedirs(log_dir, exist_ok=True)
+
+        # Workbooks written before the journal existed hold rows the
+        # journal does not, so keep them instead of exporting over them
+        if not os.path.exists(self.manifest_path):
+            for workbook in (self.success_file, self.failure_file):
+                if os.path.exists(workbook):
+                    root, ext = os.path.splitext(workbook)
+                    os.replace(workbook, f"{root}_before_journal{ext}")
+
+        self._manifest = self._load_manifest()
+        self._live = {}
+        for shard in self._manifest["shards"]:
+            if not shard["closed"]:
+                self._recount(shard)
+                self._live[shard["kind"]] = shard
+
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue = None
+        self._thread = None
+        # Held while queueing a row and while closing, so no row can be
+        # queued behind the stop marker
+        self._queue_lock = threading.Lock()
+        self._closed = False
+        if asynchronous:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(
+                target=self._write_loop, name="verification-logger", daemon=True
             )
-            ws.column_dimensions[get_column_letter(col)].width = 15
-
-        # Make the image column wider
-        ws.column_dimensions[get_column_letter(len(headers))].width = 35
-        # Make row height taller for images
-        ws.row_dimensions[1].height = self.max_image_height + 20
-
-        wb.save(self.success_file)
-
-    def _create_failure_file(self):
-        """Create the failed verifications Excel file with headers"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Failed Verifications"
-
-        # Define headers
-        headers = [
-            "Timestamp",
-            "Student ID",
-            "First Name",
-            "Last Name",
-            "Face Match",
-            "Logo Found",
-            "Pattern Count",
-            "Failure Reasons",
-            "Annotated Image",
-        ]
-
-        # Add headers with styling
-        for col, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col, value=header)
-            cell.font = Font(bold=True)
-            cell.fill = PatternFill(
-                start_color="FF0000", end_color="FF0000", fill_type="solid"
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _save_thumbnail(self, image_array, folder, key=None):
+        """Write the Excel-sized JPEG to the shard's thumbnail folder"""
+        thumbnail = thumbnails.encoded(
+            key,
+            image_array,
+            (self.max_image_width, self.max_image_height),
+            fmt="jpeg",
+        )
+        name = f"{uuid.uuid4().hex}.jpg"
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(thumbnail.data)
+        return name, thumbnail.width, thumbnail.height, len(thumbnail.data)
+
+    def _path(self, name):
+        return os.path.join(self.log_dir, name)
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        manifest = {"shards": []}
+        # Journals from before sharding become closed shards of their own
+        for kind in SHEETS:
+            if os.path.exists(self._path(f"{kind}.jsonl")):
+                shard = self._new_shard_entry(kind, None, kind, "thumbnails")
+                shard["closed"] = True
+                self._recount(shard)
+                manifest["shards"].append(shard)
+        self._manifest = manifest
+        self._save_manifest()
+        return manifest
+
+    def _save_manifest(self):
+        """
+        Write the manifest, merged under a lock with what another process
+        (the GUI's logger or the export CLI) saved since it was read
+        """
+        with _file_lock(self.manifest_path + ".lock"):
+            saved = {}
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    saved = {s["name"]: s for s in json.load(f)["shards"]}
+            for shard in self._manifest["shards"]:
+                if shard["name"] in saved:
+                    _merge_shard(shard, saved.pop(shard["name"]))
+            self._manifest["shards"].extend(saved.values())
+
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._manifest, f, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+
+    def _new_shard_entry(self, kind, day, name, thumbnails=None):
+        return {
+            "kind": kind,
+            "day": day,
+            "name": name,
+            "journal": f"{name}.jsonl",
+            "thumbnails": thumbnails or name,
+            "workbook": f"{name}.xlsx",
+            "rows": 0,
+            "bytes": 0,
+            "exported_rows": 0,
+            "closed": False,
+        }
+
+    def _recount(self, shard):
+        """Rows and bytes of a shard, read from disk (the manifest lags)"""
+        journal = self._path(shard["journal"])
+        folder = self._path(shard["thumbnails"])
+        shard["rows"] = sum(1 for _ in self._read_journal(journal))
+        shard["bytes"] = os.path.getsize(journal) if os.path.exists(journal) else 0
+        if os.path.isdir(folder):
+            shard["bytes"] += sum(
+                entry.stat().st_size for entry in os.scandir(folder)
             )
-            ws.column_dimensions[get_column_letter(col)].width = 15
-
-        # Make the Failure Reasons and image columns wider
-        ws.column_dimensions[get_column_letter(len(headers) - 1)].width = 40
-        ws.column_dimensions[get_column_letter(len(headers))].width = 35
-        # Make row height taller for images
-        ws.row_dimensions[1].height = self.max_image_height + 20
-
-        wb.save(self.failure_file)
-
-    def _resize_image_for_excel(self, image_array):
-        """Resize image to fit Excel cell while maintaining aspect ratio"""
-        # Convert CV2 image to PIL Image
-        image = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(image)
-
-        # Calculate new dimensions maintaining aspect ratio
-        width, height = pil_image.size
-        aspect_ratio = width / height
-
-        if height > self.max_image_height:
-            new_height = self.max_image_height
-            new_width = int(new_height * aspect_ratio)
-        else:
-            new_width = width
-            new_height = height
-
-        if new_width > self.max_image_width:
-            new_width = self.max_image_width
-            new_height = int(new_width / aspect_ratio)
 
-        # Resize image
-        pil_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-
-        return pil_image, new_width, new_height
-
-    def _add_image_to_cell(self, ws, row, col, image_array):
-        """Add resized image to Excel cell"""
-        # Resize image
-        pil_image, width, height = self._resize_image_for_excel(image_array)
-
-        # Save to bytes buffer
-        img_bytes = io.BytesIO()
-        pil_image.save(img_bytes, format="PNG")
-        img_bytes.seek(0)
-
-        # Add to Excel
-        img = XLImage(img_bytes)
-        img.width = width
-        img.height = height
-
-        # Position image in cell
-        ws.row_dimensions[row].height = height + 20
-        img.anchor = ws.cell(row=row, column=col).coordinate
+    def _live_shard(self, kind, day):
+        """The shard the next row of this kind goes to, starting one if needed"""
+        shard = self._live.get(kind)
+        day = day if self.shard_by_day else None
+        if shard is not None and not (
+            shard["day"] != day
+            or (self.shard_max_rows and shard["rows"] >= self.shard_max_rows)
+            or (self.shard_max_bytes and shard["bytes"] >= self.shard_max_bytes)
+        ):
+            return shard
+
+        if shard is not None:
+            shard["closed"] = True
+        prefix = f"{kind}-{day}" if day else kind
+        sequence = sum(
+            1 for s in self._manifest["shards"] if s["name"].startswith(prefix + "-")
+        )
+        shard = self._new_shard_entry(kind, day, f"{prefix}-{sequence:03d}")
+        os.makedirs(self._path(shard["thumbnails"]), exist_ok=True)
+        self._manifest["shards"].append(shard)
+        self._live[kind] = shard
+        self._save_manifest()
+        return shard
+
+    def shards(self, kind=None, day=None):
+        """Manifest entries for a kind and/or day (YYYY-MM-DD), oldest first"""
+        with self._shard_lock:
+            return [
+                dict(shard)
+                for shard in self._manifest["shards"]
+                if (kind is None or shard["kind"] == kind)
+                and (day is None or shard["day"] == day)
+            ]
+
+    def _append(self, kind, values, annotated_image, key=None):
+        row = (kind, values, annotated_image, key)
+        if self._queue is not None:
+            with self._queue_lock:
+                # After close() nothing reads the queue; write the row here
+                if not self._closed and self._thread.is_alive():
+                    try:
+                        self._queue.put_nowait(row)
+                        return
+                    except queue.Full:
+                        # The writer is behind; save this row rather than drop it
+                        print("Verification log queue full, writing synchronously")
+        self._write_rows([row])
+
+    def _write_rows(self, rows):
+        """
+        Save thumbnails, then append each shard's lines in one write. A row
+        that cannot be saved is reported and skipped; the others still are.
+        """
+        with self._shard_lock:
+            lines = {}
+            for kind, values, annotated_image, key in rows:
+                try:
+                    # Rows go to the shard for the day they were logged
+                    shard = self._live_shard(kind, values[0][:10])
+                    thumbnail, width, height, size = self._save_thumbnail(
+                        annotated_image, self._path(shard["thumbnails"]), key
+                    )
+                    line = json.dumps(
+                        {
+                            "values": values,
+                            "thumbnail": thumbnail,
+                            "width": width,
+                            "height": height,
+                        }
+                    ) + "\n"
+                except Exception as e:
+                    print(f"Error saving verification log row {values[:2]}: {e}")
+                    continue
+                lines.setdefault(shard["journal"], []).append(
+                    (shard, line, size + len(line))
+                )
+
+            for journal, entries in lines.items():
+                try:
+                    with open(self._path(journal), "a", encoding="utf-8") as f:
+                        f.write("".join(line for _, line, _ in entries))
+                except OSError as e:
+                    print(f"Error writing {len(entries)} rows to {journal}: {e}")
+                    continue
+                # Count rows only once their lines are in the journal
+                for shard, _, size in entries:
+                    shard["rows"] += 1
+                    shard["bytes"] += size
+
+    def _write_loop(self):
+        while True:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_size and items[-1] is not None:
+                if isinstance(items[-1], threading.Event):
+                    break  # flush requested: write what we have now
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            rows = [item for item in items if isinstance(item, tuple)]
+            try:
+                self._write_rows(rows)
+            except Exception as e:
+                print(f"Error writing {len(rows)} verification log rows: {e}")
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if items[-1] is None:
+                return
+
+    def flush(self, timeout=None):
+        """Wait until every row logged so far is saved. False on timeout."""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
 
-        return img
+    def close(self, timeout=10):
+        """Save queued rows and stop the writer thread"""
+        if self._thread is None:
+            return True
+        with self._queue_lock:
+            if self._closed or not self._thread.is_alive():
+                self._closed = True
+                return not self._thread.is_alive()
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _common_values(self, verification_data):
+        return [
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            verification_data.get("id_number", "N/A"),
+            verification_data.get("first_name", "N/A"),
+            verification_data.get("last_name", "N/A"),
+            verification_data.get("face_match_result", "N/A"),
+            str(verification_data.get("logo_found", False)),
+            verification_data.get("pattern_count", 0),
+        ]
 
     def log_successful_verification(
         self, verification_data, annotated_image, otp_verified=True
     ):
         """Log a successful verification with image"""
         try:
-            wb = load_workbook(self.success_file)
-            ws = wb.active
-
-            # Get next empty row
-            next_row = ws.max_row + 1
-
-            # Add verification data
-            ws.cell(
-                row=next_row,
-                column=1,
-                value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            )
-            ws.cell(
-                row=next_row, column=2, value=verification_data.get("id_number", "N/A")
-            )
-            ws.cell(
-                row=next_row, column=3, value=verification_data.get("first_name", "N/A")
-            )
-            ws.cell(
-                row=next_row, column=4, value=verification_data.get("last_name", "N/A")
+            values = self._common_values(verification_data) + [str(otp_verified)]
+            self._append(
+                "successful", values, annotated_image, verification_data.get("id")
             )
-            ws.cell(
-                row=next_row,
-                column=5,
-                value=verification_data.get("face_match_result", "N/A"),
-            )
-            ws.cell(
-                row=next_row,
-                column=6,
-                value=str(verification_data.get("logo_found", False)),
-            )
-            ws.cell(
-                row=next_row, column=7, value=verification_data.get("pattern_count", 0)
-            )
-            ws.cell(row=next_row, column=8, value=str(otp_verified))
-
-            # Add image to the last column
-            img = self._add_image_to_cell(ws, next_row, 9, annotated_image)
-            ws.add_image(img)
-
-            wb.save(self.success_file)
             return True
         except Exception as e:
             print(f"Error logging successful verification: {e}")
@@ -199,53 +417,151 @@ class VerificationLogger:
     def log_failed_verification(self, verification_data, annotated_image):
         """Log a failed verification with image"""
         try:
-            wb = load_workbook(self.failure_file)
-            ws = wb.active
-
-            # Get next empty row
-            next_row = ws.max_row + 1
-
-            # Add verification data
-            ws.cell(
-                row=next_row,
-                column=1,
-                value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            )
-            ws.cell(
-                row=next_row, column=2, value=verification_data.get("id_number", "N/A")
-            )
-            ws.cell(
-                row=next_row, column=3, value=verification_data.get("first_name", "N/A")
-            )
-            ws.cell(
-                row=next_row, column=4, value=verification_data.get("last_name", "N/A")
-            )
-            ws.cell(
-                row=next_row,
-                column=5,
-                value=verification_data.get("face_match_result", "N/A"),
-            )
-            ws.cell(
-                row=next_row,
-                column=6,
-                value=str(verification_data.get("logo_found", False)),
-            )
-            ws.cell(
-                row=next_row, column=7, value=verification_data.get("pattern_count", 0)
-            )
-
             # Combine all failure reasons into one string
             failure_reasons = " | ".join(
                 verification_data.get("failure_reasons", ["Unknown"])
             )
-            ws.cell(row=next_row, column=8, value=failure_reasons)
-
-            # Add image to the last column
-            img = self._add_image_to_cell(ws, next_row, 9, annotated_image)
-            ws.add_image(img)
-
-            wb.save(self.failure_file)
+            values = self._common_values(verification_data) + [failure_reasons]
+            self._append(
+                "failed", values, annotated_image, verification_data.get("id")
+            )
             return True
         except Exception as e:
             print(f"Error logging failed verification: {e}")
             return False
+
+    def _read_journal(self, journal):
+        if not os.path.exists(journal):
+            return
+        with open(journal, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # A line cut short by a crash; the rest are intact
+                    continue
+
+    def _export(self, journal, path, sheet, thumbnail_dir):
+        """Write one workbook from its journal with openpyxl's write-only mode"""
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet["title"])
+        headers = sheet["headers"]
+        image_column = get_column_letter(len(headers))
+
+        # Column widths and row heights have to be set before rows stream out
+        for col in range(1, len(headers) + 1):
+            width = sheet["widths"].get(col, 15)
+            ws.column_dimensions[get_column_letter(col)].width = width
+        ws.row_dimensions[1].height = self.max_image_height + 20
+
+        # Add headers with styling
+        fill = PatternFill(
+            start_color=sheet["color"], end_color=sheet["color"], fill_type="solid"
+        )
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = Font(bold=True)
+            cell.fill = fill
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        row = 1
+        for entry in self._read_journal(journal):
+            row += 1
+            ws.row_dimensions[row].height = entry["height"] + 20
+            ws.append(entry["values"])
+
+            thumbnail_path = os.path.join(thumbnail_dir, entry["thumbnail"])
+            if not os.path.exists(thumbnail_path):
+                continue
+            with open(thumbnail_path, "rb") as f:
+                img = XLImage(io.BytesIO(f.read()))
+            img.width = entry["width"]
+            img.height = entry["height"]
+            img.anchor = f"{image_column}{row}"
+            ws.add_image(img)
+
+        tmp_path = path + ".tmp"
+        wb.save(tmp_path)
+        os.replace(tmp_path, path)
+        return row - 1
+
+    def export(self, kind=None, day=None):
+        """
+        Build the workbook of every shard that has rows it does not have yet.
+        Closed shards that were already exported are skipped.
+        """
+        exported = {}
+        for shard in self.shards(kind, day):
+            if shard.get("archived"):
+                continue
+            workbook = self._path(shard["workbook"])
+            if shard["exported_rows"] == shard["rows"] and (
+                os.path.exists(workbook) or not shard["rows"]
+            ):
+                continue
+            rows = self._export(
+                self._path(shard["journal"]),
+                workbook,
+                SHEETS[shard["kind"]],
+                self._path(shard["thumbnails"]),
+            )
+            with self._shard_lock:
+                for entry in self._manifest["shards"]:
+                    if entry["name"] == shard["name"]:
+                        entry["exported_rows"] = rows
+                self._save_manifest()
+            exported[workbook] = rows
+            print(f"Exported {rows} rows to {workbook}")
+        return exported
+
+    def archive(self, before, destination):
+        """
+        Move closed shards from days before `before` (YYYY-MM-DD), with
+        their thumbnails and workbooks, into the destination folder
+        """
+        os.makedirs(destination, exist_ok=True)
+        archived = []
+        with self._shard_lock:
+            for shard in self._manifest["shards"]:
+                if (
+                    not shard["closed"]
+                    or shard.get("archived")
+                    or shard["day"] is None
+                    or shard["day"] >= before
+                ):
+                    continue
+                for key in ("journal", "thumbnails", "workbook"):
+                    if os.path.exists(self._path(shard[key])):
+                        shutil.move(self._path(shard[key]), destination)
+                shard["archived"] = destination
+                archived.append(shard["name"])
+            self._save_manifest()
+        return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the verification workbooks from the journal"
+    )
+    parser.add_argument("command", nargs="?", choices=["export", "archive"])
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("--kind", choices=sorted(SHEETS))
+    parser.add_argument("--day", help="Only shards of this day (YYYY-MM-DD)")
+    parser.add_argument("--before", help="archive: shards older than this day")
+    parser.add_argument("--to", help="archive: destination (default: log dir/archive)")
+    args = parser.parse_args()
+
+    logger = VerificationLogger(args.log_dir, asynchronous=False)
+    if args.command == "archive":
+        if not args.before:
+            parser.error("archive needs --before")
+        destination = args.to or os.path.join(args.log_dir, "archive")
+        print(f"Archived: {logger.archive(args.before, destination)}")
+        return
+    logger.export(args.kind, args.day)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+GALLERY_DIR = os.getenv("GALLERY_DIR", "gallery")
+GALLERY_DTYPE = os.getenv("GALLERY_DTYPE", "float16")  # float16 | float32
+EMBEDDING_SIZE = 512
+INITIAL_CAPACITY = 1024
+# Proposed enrolments wait this long for the student to confirm them
+GALLERY_CONFIRM_SECONDS = float(os.getenv("GALLERY_CONFIRM_SECONDS", "900"))
+MAX_PROPOSALS = 1024
+
+
+def _normalise(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[None, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+class FaceGallery:
+    """
+    FaceNet embeddings of enrolled students, one per id_number.
+
+    Embeddings are stored L2-normalised as rows of one contiguous matrix in
+    embeddings.npy, which is memory-mapped at start-up and grown by doubling
+    its capacity, so enrolling a student writes one row. ids.json maps rows
+    to id_numbers.
+
+    A verification only proposes an enrolment; it is written once the
+    student confirms their identity (the OTP step) with confirm().
+
+    Inference worker processes open the gallery read_only: they map the
+    file read-only, remap it when ids.json changes, and keep proposals
+    in a pending list for the one writing process to take over.
+    """
+
+    def __init__(self, directory=GALLERY_DIR, dtype=GALLERY_DTYPE, read_only=False):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.read_only = read_only
+        self.matrix_path = os.path.join(directory, "embeddings.npy")
+        self.ids_path = os.path.join(directory, "ids.json")
+        self._lock = threading.Lock()
+        self._ids = []
+        self._rows = {}
+        self._matrix = None
+        # float32 rows [:len(ids)] and ids for lookup, rebuilt after changes
+        self._snapshot = None
+        self._loaded_mtime = None
+        self._pending = []
+        self._proposals = OrderedDict()
+
+        self._load()
+        if self._ids:
+            print(f"Loaded face gallery with {len(self._ids)} students")
+
+    def _load(self):
+        if not (os.path.exists(self.matrix_path) and os.path.exists(self.ids_path)):
+            return
+        # ids.json is written after the matrix rows, so reading it first
+        # never yields an id whose row is missing
+        self._loaded_mtime = os.stat(self.ids_path).st_mtime_ns
+        with open(self.ids_path) as f:
+            self._ids = json.load(f)
+        self._rows = {id_number: row for row, id_number in enumerate(self._ids)}
+        self._snapshot = None
+        if self.read_only:
+            self._matrix = np.load(self.matrix_path, mmap_mode="r")
+        else:
+            self._matrix = np.lib.format.open_memmap(self.matrix_path, mode="r+")
+
+    def _refresh(self):
+        if not self.read_only:
+            return
+        try:
+            mtime = os.stat(self.ids_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._loaded_mtime:
+            self._load()
+
+    def take_pending(self):
+        """Return and clear the proposals a read_only gallery has held back"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        return pending
+
+    def __len__(self):
+        # Callers skip get/lookup on an empty gallery, so a read_only copy
+        # has to notice new enrolments here too
+        with self._lock:
+            self._refresh()
+            return len(self._ids)
+
+    def _ensure_capacity(self, rows):
+        capacity = 0 if self._matrix is None else self._matrix.shape[0]
+        if rows <= capacity:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        new_capacity = max(INITIAL_CAPACITY, capacity * 2, rows)
+        tmp_path = self.matrix_path + ".tmp"
+        matrix = np.lib.format.open_memmap(
+            tmp_path,
+            mode="w+",
+            dtype=self.dtype,
+            shape=(new_capacity, EMBEDDING_SIZE),
+        )
+        if capacity:
+            matrix[: len(self._ids)] = self._matrix[: len(self._ids)]
+        matrix.flush()
+        del matrix
+        self._matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self._matrix = np.lib.format.open_memmap(self.matrix_path, mode="r+")
+
+    def _save_ids(self):
+        tmp_path = self.ids_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._ids, f)
+        os.replace(tmp_path, self.ids_path)
+
+    def propose(self, id_number, embedding):
+        """Hold an embedding for a student until confirm(id_number)"""
+        embedding = _normalise(embedding)[0]
+        with self._lock:
+            if self.read_only:
+                self._pending.append((id_number, embedding))
+                return
+            self._proposals[id_number] = (embedding, time.monotonic())
+            self._proposals.move_to_end(id_number)
+            while len(self._proposals) > MAX_PROPOSALS:
+                self._proposals.popitem(last=False)
+
+    def confirm(self, id_number):
+        """Enrol the embedding proposed for a student; False if there is none"""
+        with self._lock:
+            proposal = self._proposals.pop(id_number, None)
+        if proposal is None:
+            return False
+        embedding, proposed_at = proposal
+        if time.monotonic() - proposed_at > GALLERY_CONFIRM_SECONDS:
+            return False
+        self.enroll(id_number, embedding)
+        return True
+
+    def enroll(self, id_number, embedding):
+        """Add or replace the enrolled embedding for a student"""
+        if self.read_only:
+            raise ValueError("Cannot enrol into a read_only gallery")
+        embedding = _normalise(embedding)[0]
+        with self._lock:
+            row = self._rows.get(id_number)
+            if row is None:
+                row = len(self._ids)
+                self._ensure_capacity(row + 1)
+                self._ids.append(id_number)
+                self._rows[id_number] = row
+            self._matrix[row] = embedding.astype(self.dtype)
+            self._matrix.flush()
+            self._save_ids()
+            self._snapshot = None
+
+    def get(self, id_number):
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(id_number)
+            if row is None:
+                return None
+            return np.array(self._matrix[row], dtype=np.float32)
+
+    def lookup(self, embeddings, k=1):
+        """
+        Cosine top-k for a batch of embeddings. Returns, for each query, a
+        list of (id_number, similarity) sorted best first.
+        """
+        queries = _normalise(embeddings)
+        with self._lock:
+            self._refresh()
+            if not self._ids:
+                return [[] for _ in queries]
+            if self._snapshot is None:
+                # A view of the memory map when it is already float32; a
+                # float16 gallery is converted once per change, not per call
+                count = len(self._ids)
+                matrix = self._matrix[:count].astype(np.float32, copy=False)
+                self._snapshot = (matrix, list(self._ids))
+            matrix, ids = self._snapshot
+
+        count = len(ids)
+        similarities = queries @ matrix.T
+        k = min(k, count)
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for query_similarities, candidates in zip(similarities, top):
+            candidates = candidates[np.argsort(-query_similarities[candidates])]
+            results.append(
+                [(ids[i], float(query_similarities[i])) for i in candidates]
+            )
+        return results
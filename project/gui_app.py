@@ -7,9 +7,11 @@ from PIL import Image, ImageTk
 import json
 import threading
 import time
+import uuid
 from datetime import datetime
 from excel_logger import VerificationLogger
-import os
+from wire_format import client_accept_header, decode_body
+from thumbnails import EMAIL_SIZE, PREVIEW_SIZE, service as thumbnails
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -38,6 +40,8 @@ class VerificationApp(ctk.CTk):
         self.current_frame = None
         self.verification_result = None
         self.api_url = "http://127.0.0.1:5000"
+        # Lets the server reuse detections while the camera scene is static
+        self.session_id = str(uuid.uuid4())
         self.logger = VerificationLogger()
         self.annotated_image = None
 
@@ -134,8 +138,10 @@ class VerificationApp(ctk.CTk):
         result_frame.pack(fill="both", expand=True, padx=20, pady=20)
 
         # Show annotated image
-        img = Image.fromarray(cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB))
-        img = self.resize_image(img, 800, 600)
+        preview = thumbnails.image(
+            result_json.get("id"), annotated_image, PREVIEW_SIZE, upscale=True
+        )
+        img = Image.fromarray(cv2.cvtColor(preview, cv2.COLOR_BGR2RGB))
         photo = ImageTk.PhotoImage(img)
 
         image_label = ctk.CTkLabel(result_frame, image=photo, text="")
@@ -203,9 +209,8 @@ class VerificationApp(ctk.CTk):
             if ret:
                 self.current_frame = frame
                 # Display frame
-                img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(img)
-                img = self.resize_image(img, 800, 600)
+                img = self.resize_image(frame, *PREVIEW_SIZE)
+                img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
                 photo = ImageTk.PhotoImage(img)
                 self.camera_label.configure(image=photo)
                 self.camera_label.image = photo
@@ -230,17 +235,27 @@ class VerificationApp(ctk.CTk):
 
             # Send to API
             response = requests.post(
-                f"{self.api_url}/verifications", files={"image": img_encoded.tobytes()}
+                f"{self.api_url}/verifications",
+                files={"image": img_encoded.tobytes()},
+                # Only the final frame's annotated image is shown, so ask for
+                # boxes as data and let the server render the saved frame
+                data={"session_id": self.session_id, "annotate": "data"},
+                headers={"Accept": client_accept_header()},
             )
 
             if response.status_code == 201:
-                result_json = response.json()
+                result_json, img_data = decode_body(
+                    response.headers.get("Content-Type"), response.content
+                )
 
                 # If all labels detected, show results
                 if result_json.get("all_labels_detected", False):
                     self.is_capturing = False
-                    # Get annotated image from base64
-                    img_data = base64.b64decode(result_json["annotated_image_base64"])
+                    # Raw JPEG bytes, or base64 when the server answered JSON
+                    if img_data is None:
+                        img_data = base64.b64decode(
+                            result_json["annotated_image_base64"]
+                        )
                     nparr = np.frombuffer(img_data, np.uint8)
                     annotated_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
 
@@ -293,20 +308,10 @@ class VerificationApp(ctk.CTk):
         except Exception as e:
             print(f"Error verifying OTP: {e}")
 
-    def resize_image_for_email(self, image, max_size=(800, 600)):
+    def resize_image_for_email(self, image, max_size=EMAIL_SIZE):
         """Resize image for email attachment while maintaining aspect ratio"""
-        height, width = image.shape[:2]
-
-        # Calculate new dimensions
-        if width > max_size[0] or height > max_size[1]:
-            ratio = min(max_size[0] / width, max_size[1] / height)
-            new_width = int(width * ratio)
-            new_height = int(height * ratio)
-            image = cv2.resize(
-                image, (new_width, new_height), interpolation=cv2.INTER_AREA
-            )
-
-        return image
+        key = self.verification_result and self.verification_result.get("id")
+        return thumbnails.image(key, image, max_size)
 
     def send_alarm(self, student_id, annotated_image):
         """Send alarm email and log the failed verification"""
@@ -321,21 +326,8 @@ class VerificationApp(ctk.CTk):
             if not verification_id:
                 raise ValueError("Verification ID not found in results")
 
-            # Get the path to the saved annotated image
-            img_path = os.path.join("results", verification_id, "annotated.jpg")
-            print(f"Looking for image at: {img_path}")
-
-            if not os.path.exists(img_path):
-                print("Image file not found!")
-                # Try to save the image directly
-                print("Attempting to save image directly...")
-                os.makedirs(os.path.join("results", verification_id), exist_ok=True)
-                cv2.imwrite(img_path, annotated_image)
-                if not os.path.exists(img_path):
-                    raise ValueError(f"Failed to save image at {img_path}")
-                print("Image saved successfully")
-
-            # Send security alarm using the API endpoint
+            # Send security alarm using the API endpoint, which checks that
+            # the annotated image was saved
             print("Calling security alarm API endpoint...")
             response = requests.post(
                 f"{self.api_url}/security/alarm",
@@ -366,10 +358,8 @@ class VerificationApp(ctk.CTk):
                 self.show_message(
                     "Error", "Could not find verification results. Please try again."
                 )
-            elif "Image file not found" in error_msg:
-                self.show_message(
-                    "Error", "Could not save or find the verification image."
-                )
+            elif "Annotated image not found" in error_msg:
+                self.show_message("Error", "Could not find the verification image.")
             else:
                 self.show_message("Error", f"Failed to send alert: {error_msg}")
 
@@ -386,15 +376,15 @@ class VerificationApp(ctk.CTk):
         button.pack(pady=10)
 
     def resize_image(self, img, max_width, max_height):
-        """Resize image maintaining aspect ratio"""
-        ratio = min(max_width / img.width, max_height / img.height)
-        new_size = (int(img.width * ratio), int(img.height * ratio))
-        return img.resize(new_size, Image.Resampling.LANCZOS)
+        """Resize a BGR frame maintaining aspect ratio"""
+        return thumbnails.image(None, img, (max_width, max_height), upscale=True)
 
     def on_closing(self):
         """Clean up resources when closing"""
         if self.cap is not None:
             self.cap.release()
+        # Save any verification log rows still queued
+        self.logger.close()
         self.quit()
 
 
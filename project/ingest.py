@@ -0,0 +1,83 @@
+import io
+import os
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Uploads whose longest side is well above this are decoded at 1/2, 1/4 or
+# 1/8 scale. YOLO runs at 320 and faces are resized to 160, so the detectors
+# never need the full 12MP a phone sends.
+INGEST_TARGET_SIZE = int(os.getenv("INGEST_TARGET_SIZE", "960"))
+
+REDUCED_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def image_size(data):
+    """Read (width, height) from the image header without decoding pixels"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def choose_scale(size, target=INGEST_TARGET_SIZE):
+    """Largest decode factor that keeps the longest side at or above target"""
+    if size is None:
+        return 1
+    longest = max(size)
+    for factor in (8, 4, 2):
+        if longest // factor >= target:
+            return factor
+    return 1
+
+
+class Upload:
+    """
+    An uploaded image decoded at reduced scale for the detectors. The full
+    resolution image is only decoded if something asks for it, which today
+    is OCR of the ID-card text fields.
+    """
+
+    def __init__(self, data, target=INGEST_TARGET_SIZE):
+        self._buffer = np.frombuffer(data, np.uint8)
+        self.scale = choose_scale(image_size(data), target)
+        self.frame = cv2.imdecode(self._buffer, REDUCED_FLAGS[self.scale])
+        if self.frame is None and self.scale != 1:
+            # Header said one thing, decoder another; fall back to full size
+            self.scale = 1
+            self.frame = cv2.imdecode(self._buffer, cv2.IMREAD_COLOR)
+        self._full_frame = self.frame if self.scale == 1 else None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_parts(cls, buffer, frame, scale):
+        """Rebuild an Upload from an already decoded frame, without decoding"""
+        upload = cls.__new__(cls)
+        upload._buffer = buffer
+        upload.scale = scale
+        upload.frame = frame
+        upload._full_frame = frame if scale == 1 else None
+        upload._lock = threading.Lock()
+        return upload
+
+    def full_frame(self):
+        # Several OCR threads may ask at once; decode only once
+        with self._lock:
+            if self._full_frame is None:
+                self._full_frame = cv2.imdecode(self._buffer, cv2.IMREAD_COLOR)
+        return self._full_frame
+
+    def full_roi(self, bbox):
+        """Crop an (x1, y1, x2, y2) box given in reduced-frame coordinates"""
+        full = self.full_frame()
+        h, w = full.shape[:2]
+        x1, y1, x2, y2 = (int(v * self.scale) for v in bbox)
+        return full[max(0, y1) : min(h, y2), max(0, x1) : min(w, x2)]
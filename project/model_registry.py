@@ -0,0 +1,110 @@
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # memory figures are reported as None without psutil
+    psutil = None
+
+
+def _rss_bytes():
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+class ModelRegistry:
+    """
+    Loads models on first use (or in an explicit warm-up) instead of at import
+    time, and records how long each one took to load and how much memory it
+    added to the process.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._locks = {}
+        self._models = {}
+        self._stats = {}
+        self._per_thread = set()
+        self._local = threading.local()
+
+    def register(self, name, loader, per_thread=False):
+        """
+        Register a zero-argument loader under a model name. per_thread models
+        are not safe to call concurrently, so each inference thread loads
+        its own copy.
+        """
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._stats[name] = {
+            "loaded": False,
+            "load_seconds": None,
+            "memory_bytes": None,
+            "copies": 0,
+            "error": None,
+        }
+        if per_thread:
+            self._per_thread.add(name)
+
+    def get(self, name):
+        """Return the model, loading it if this is the first use"""
+        if name in self._per_thread:
+            models = self._local.__dict__.setdefault("models", {})
+            if name not in models:
+                models[name] = self._load(name)
+            return models[name]
+
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            # Another thread may have finished loading while we waited
+            if name in self._models:
+                return self._models[name]
+            self._models[name] = self._load(name)
+            return self._models[name]
+
+    def _load(self, name):
+        print(f"Loading model: {name}")
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = self._loaders[name]()
+        except Exception as e:
+            self._stats[name]["error"] = str(e)
+            print(f"Failed to load model {name}: {e}")
+            raise
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+
+        self._stats[name].update(
+            {
+                "loaded": True,
+                "load_seconds": round(elapsed, 3),
+                "memory_bytes": (
+                    rss_after - rss_before if rss_before is not None else None
+                ),
+                "copies": self._stats[name]["copies"] + 1,
+                "error": None,
+            }
+        )
+        print(f"Loaded model {name} in {elapsed:.2f}s")
+        return model
+
+    def warm_up(self, names=None):
+        """Load the given models (default: all) and report any failures"""
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception:
+                pass
+        return self.is_ready(names)
+
+    def is_ready(self, names=None):
+        return all(
+            self._stats[name]["loaded"] for name in names or self._loaders
+        )
+
+    def status(self):
+        return {name: dict(stats) for name, stats in self._stats.items()}
@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Mean absolute difference (0-255 gray levels) between downscaled frames
+# below which the scene counts as unchanged
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "4.0"))
+# Force full inference after this many reused frames, even for a still scene
+MOTION_MAX_REUSE = int(os.getenv("MOTION_MAX_REUSE", "15"))
+# Forget sessions that have not sent a frame for this many seconds
+MOTION_SESSION_TTL = float(os.getenv("MOTION_SESSION_TTL", "60"))
+
+SIGNATURE_SIZE = (64, 48)
+
+
+def frame_signature(frame):
+    """Small blurred grayscale copy of a frame used for differencing"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, SIGNATURE_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (3, 3), 0).astype(np.int16)
+
+
+class MotionGate:
+    """
+    Per-session frame differencing. While a session's scene stays within
+    the threshold of the frame that last ran full inference, that frame's
+    detections (YOLO boxes and face boxes) are handed back for reuse.
+    """
+
+    def __init__(
+        self,
+        threshold=MOTION_THRESHOLD,
+        max_reuse=MOTION_MAX_REUSE,
+        session_ttl=MOTION_SESSION_TTL,
+    ):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.session_ttl = session_ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def check(self, session_id, frame):
+        """
+        Return (signature, detections). detections is None when the frame
+        needs full inference.
+        """
+        signature = frame_signature(frame)
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return signature, None
+            session["last_seen"] = now
+
+            if (
+                session["shape"] != frame.shape
+                or session["reused"] >= self.max_reuse
+            ):
+                return signature, None
+
+            motion = np.abs(signature - session["signature"]).mean()
+            if motion > self.threshold:
+                return signature, None
+
+            session["reused"] += 1
+            return signature, session["detections"]
+
+    def store(self, session_id, frame, signature, detections):
+        """Remember the detections of a frame that ran full inference"""
+        with self._lock:
+            self._sessions[session_id] = {
+                "signature": signature,
+                "shape": frame.shape,
+                "detections": detections,
+                "reused": 0,
+                "last_seen": time.monotonic(),
+            }
+
+    def _evict(self, now):
+        expired = [
+            session_id
+            for session_id, session in self._sessions.items()
+            if now - session["last_seen"] > self.session_ttl
+        ]
+        for session_id in expired:
+            del self._sessions[session_id]
@@ -0,0 +1,309 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import pytesseract
+
+# auto | tesserocr | pytesseract
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+
+# Set Tesseract path if necessary (falls back to tesseract on the PATH)
+TESSERACT_CMD = os.getenv(
+    "TESSERACT_CMD", r"C:/Program Files/Tesseract-OCR/tesseract.exe"
+)
+if os.path.exists(TESSERACT_CMD):
+    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+
+# Threads used to read ID-card fields concurrently with the face stages
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "3"))
+
+# Recently read ROIs are remembered by perceptual hash so repeated frames of
+# the same card skip tesseract
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "256"))
+OCR_CACHE_TTL = float(os.getenv("OCR_CACHE_TTL", "10"))  # seconds
+OCR_CACHE_MAX_DISTANCE = int(os.getenv("OCR_CACHE_MAX_DISTANCE", "4"))  # bits
+
+# White gap between ROIs when several are stacked into one tesseract image
+STACK_PADDING = 20
+
+
+def clean_text(text):
+    return re.sub(r"[^a-zA-Z0-9\s]", "", text.strip())
+
+
+class TesserocrEngine:
+    """
+    Keeps one loaded tesseract API per thread, so reading a field is a
+    library call instead of a new tesseract process and a temp file
+    """
+
+    def __init__(self):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self._local = threading.local()
+        tessdata = os.path.join(os.path.dirname(TESSERACT_CMD), "tessdata")
+        self._tessdata = tessdata if os.path.isdir(tessdata) else None
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            kwargs = {"psm": self._tesserocr.PSM.AUTO}
+            if self._tessdata:
+                kwargs["path"] = self._tessdata
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+            self._local.api = api
+        return api
+
+    def read_fields(self, images):
+        """Recognise a list of grayscale ROIs with this thread's engine"""
+        api = self._api()
+        texts = []
+        for image in images:
+            image = np.ascontiguousarray(image)
+            h, w = image.shape[:2]
+            api.SetImageBytes(image.tobytes(), w, h, 1, w)
+            texts.append(api.GetUTF8Text().strip())
+        return texts
+
+
+class PytesseractEngine:
+    """
+    Fallback for machines without tesserocr. Every call still starts a
+    tesseract process, so the ROIs are stacked into one image to pay that
+    cost once per frame rather than once per field.
+    """
+
+    def read_fields(self, images):
+        if not images:
+            return []
+        if len(images) == 1:
+            return [pytesseract.image_to_string(images[0]).strip()]
+
+        width = max(image.shape[1] for image in images)
+        height = sum(image.shape[0] for image in images)
+        height += STACK_PADDING * (len(images) + 1)
+        canvas = np.full((height, width + 2 * STACK_PADDING), 255, dtype=np.uint8)
+
+        bands = []
+        y = STACK_PADDING
+        for image in images:
+            h, w = image.shape[:2]
+            canvas[y : y + h, STACK_PADDING : STACK_PADDING + w] = image
+            bands.append((y, y + h))
+            y += h + STACK_PADDING
+
+        data = pytesseract.image_to_data(canvas, output_type=pytesseract.Output.DICT)
+        words = [[] for _ in images]
+        for text, top, word_height in zip(data["text"], data["top"], data["height"]):
+            if not text.strip():
+                continue
+            centre = top + word_height / 2
+            for i, (band_top, band_bottom) in enumerate(bands):
+                if band_top <= centre <= band_bottom:
+                    words[i].append(text)
+                    break
+        return [" ".join(field_words) for field_words in words]
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine(OCR_BACKEND)
+    return _engine
+
+
+def _create_engine(backend):
+    if backend in ("auto", "tesserocr"):
+        try:
+            engine = TesserocrEngine()
+            print("OCR backend: tesserocr")
+            return engine
+        except ImportError:
+            if backend == "tesserocr":
+                raise
+    elif backend != "pytesseract":
+        raise ValueError(f"Unknown OCR backend: {backend}")
+    print("OCR backend: pytesseract")
+    return PytesseractEngine()
+
+
+def perceptual_hash(image, hash_size=16):
+    """
+    DCT hash of a grayscale ROI. The ROI is resized and contrast-stretched
+    first, so small shifts in exposure or position give the same bits.
+    """
+    size = hash_size * 4
+    small = cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA)
+    small = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size].flatten()
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class OcrCache:
+    """Bounded LRU of OCR results keyed on (field, perceptual hash)"""
+
+    def __init__(
+        self,
+        max_entries=OCR_CACHE_SIZE,
+        ttl=OCR_CACHE_TTL,
+        max_distance=OCR_CACHE_MAX_DISTANCE,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, field, image_hash):
+        now = time.monotonic()
+        with self._lock:
+            key = (field, image_hash)
+            if key not in self._entries and self.max_distance > 0:
+                key = self._nearest(field, image_hash)
+
+            entry = self._entries.get(key) if key else None
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _nearest(self, field, image_hash):
+        best_key, best_distance = None, self.max_distance + 1
+        for key in self._entries:
+            if key[0] != field:
+                continue
+            distance = bin(key[1] ^ image_hash).count("1")
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def put(self, field, image_hash, text):
+        with self._lock:
+            key = (field, image_hash)
+            self._entries[key] = (text, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+            }
+
+
+cache = OcrCache()
+
+
+def read_cached(image, field=None):
+    """Read one ROI, answering from the cache when the same ROI was just read"""
+    image_hash = perceptual_hash(image)
+    text = cache.get(field, image_hash)
+    if text is None:
+        text = get_engine().read_fields([image])[0]
+        cache.put(field, image_hash, text)
+    return text
+
+
+_pool = None
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _engine_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=OCR_WORKERS, thread_name_prefix="ocr"
+                )
+    return _pool
+
+
+def _read_and_cache(image, field, image_hash, loader=None):
+    if loader is not None:
+        image = loader()
+    text = get_engine().read_fields([image])[0]
+    cache.put(field, image_hash, text)
+    return text
+
+
+def _read_and_cache_all(misses):
+    """Read several [(image, field, image_hash, loader)] in one engine call"""
+    images = [image if loader is None else loader() for image, _, _, loader in misses]
+    texts = get_engine().read_fields(images)
+    for (_, field, image_hash, _), text in zip(misses, texts):
+        cache.put(field, image_hash, text)
+    return texts
+
+
+def _fan_out(batch, futures):
+    # Hand each field its own text (or the batch's exception)
+    error = batch.exception()
+    if error is not None:
+        for future in futures:
+            future.set_exception(error)
+        return
+    for future, text in zip(futures, batch.result()):
+        future.set_result(text)
+
+
+def submit_fields(images, fields=None, loaders=None):
+    """
+    Start reading each grayscale ROI on the OCR pool and return one Future
+    per ROI. Each pool thread keeps its own engine, so the fields are read
+    in parallel. ROIs found in the cache get an already-completed Future.
+    With the pytesseract fallback the misses go to the pool as one task,
+    so they are stacked and cost one tesseract process per frame.
+
+    loaders are optional callables returning a sharper copy of each ROI
+    (e.g. from the full-resolution upload). They run on the pool, and only
+    on a cache miss; the cache key still comes from images.
+    """
+    pool = get_pool()
+    fields = fields or [None] * len(images)
+    loaders = loaders or [None] * len(images)
+    stack = isinstance(get_engine(), PytesseractEngine)
+    futures, misses, miss_futures = [], [], []
+    for image, field, loader in zip(images, fields, loaders):
+        image_hash = perceptual_hash(image)
+        text = cache.get(field, image_hash)
+        if text is not None:
+            future = Future()
+            future.set_result(text)
+        elif stack:
+            future = Future()
+            misses.append((image, field, image_hash, loader))
+            miss_futures.append(future)
+        else:
+            future = pool.submit(_read_and_cache, image, field, image_hash, loader)
+        futures.append(future)
+
+    if misses:
+        batch = pool.submit(_read_and_cache_all, misses)
+        batch.add_done_callback(lambda batch: _fan_out(batch, miss_futures))
+    return futures
@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Jobs waiting to be written; create_verification blocks once this is full
+PERSIST_QUEUE_SIZE = int(os.getenv("PERSIST_QUEUE_SIZE", "256"))
+# Up to this many verifications are written and then fsynced together
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "32"))
+PERSIST_FSYNC = os.getenv("PERSIST_FSYNC", "1") == "1"
+# Saved images are evidence, so they keep the quality they always had
+SAVED_JPEG_QUALITY = 95
+
+
+def _to_bytes(content):
+    """Artifacts may be given as bytes, text or a BGR image still to encode"""
+    if isinstance(content, bytes):
+        return content
+    if isinstance(content, str):
+        return content.encode("utf-8")
+    if isinstance(content, np.ndarray):
+        ok, buffer = cv2.imencode(
+            ".jpg", content, [cv2.IMWRITE_JPEG_QUALITY, SAVED_JPEG_QUALITY]
+        )
+        if not ok:
+            raise ValueError("Could not encode image")
+        return buffer.tobytes()
+    raise TypeError(f"Unsupported artifact type: {type(content).__name__}")
+
+
+class ArtifactWriter:
+    """
+    Saves completed verifications to the VerificationStore on a background
+    thread.
+
+    Queued verifications are written in batches: their blobs are appended
+    and fsynced together and their records committed in one transaction.
+    Until then the record is served from pending(), and readers that need
+    the files straight away can wait() for them.
+    """
+
+    def __init__(
+        self,
+        store,
+        max_queue=PERSIST_QUEUE_SIZE,
+        batch_size=PERSIST_BATCH_SIZE,
+        fsync=PERSIST_FSYNC,
+    ):
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.fsync = fsync
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._written = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_seconds = None
+        self._thread = threading.Thread(
+            target=self._write_loop, name="artifact-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, verification_id, result, files):
+        """
+        Queue a result record and its {filename: bytes | str | image} files
+        """
+        done = threading.Event()
+        with self._lock:
+            self._pending[verification_id] = (result, done)
+        self._queue.put((verification_id, result, files, done))
+        return done
+
+    def pending(self, verification_id):
+        """The record of a verification that is queued but not yet saved"""
+        with self._lock:
+            entry = self._pending.get(verification_id)
+        return None if entry is None else entry[0]
+
+    def wait(self, verification_id, timeout=None):
+        """Block until a queued verification is saved. False on timeout."""
+        with self._lock:
+            entry = self._pending.get(verification_id)
+        return entry is None or entry[1].wait(timeout)
+
+    def flush(self, timeout=None):
+        """Wait for everything queued so far"""
+        with self._lock:
+            pending = [done for _, done in self._pending.values()]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for done in pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if not done.wait(remaining):
+                return False
+        return True
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            "written": self._written,
+            "failed": self._failed,
+            "fsync_batches": self._batches,
+            "last_batch_seconds": self._last_batch_seconds,
+        }
+
+    def _write_loop(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            start = time.perf_counter()
+            records = []
+            for verification_id, result, files, done in jobs:
+                try:
+                    files = {name: _to_bytes(data) for name, data in files.items()}
+                    records.append((verification_id, result, files))
+                except Exception as e:
+                    print(f"Failed to save verification {verification_id}: {e}")
+                    self._failed += 1
+
+            try:
+                self.store.put_many(records, fsync=self.fsync)
+                self._written += len(records)
+            except Exception as e:
+                print(f"Failed to save {len(records)} verifications: {e}")
+                self._failed += len(records)
+
+            for verification_id, _, _, done in jobs:
+                self._finish(verification_id, done)
+            self._batches += 1
+            self._last_batch_seconds = round(time.perf_counter() - start, 4)
+
+    def _finish(self, verification_id, done):
+        with self._lock:
+            entry = self._pending.get(verification_id)
+            if entry is not None and entry[1] is done:
+                del self._pending[verification_id]
+        done.set()
@@ -0,0 +1,23 @@
+import os
+
+import uvicorn
+from a2wsgi import WSGIMiddleware
+
+from api import app, start
+
+# Production entry point. uvicorn accepts connections and parses HTTP on an
+# event loop; Flask handlers run on a pool of HTTP_THREADS threads. Inference
+# runs on the batcher's own INFERENCE_WORKERS, so slow OTP emails and file
+# downloads hold an HTTP thread, never an inference slot.
+#
+#   INFERENCE_POOL=process INFERENCE_WORKERS=2 HTTP_THREADS=32 python serve.py
+HTTP_THREADS = int(os.getenv("HTTP_THREADS", "32"))
+HOST = os.getenv("API_HOST", "0.0.0.0")
+PORT = int(os.getenv("API_PORT", "5000"))
+
+asgi_app = WSGIMiddleware(app, workers=HTTP_THREADS)
+
+
+if __name__ == "__main__":
+    start()
+    uvicorn.run(asgi_app, host=HOST, port=PORT)
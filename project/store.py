@@ -0,0 +1,371 @@
+import base64
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+RESULTS_FOLDER = "results"
+# Start a new blob segment once the current one reaches this size
+STORE_SEGMENT_MAX_MB = int(os.getenv("STORE_SEGMENT_MAX_MB", "1024"))
+
+# Recently used records kept in memory in front of the store. Records are
+# cached without their preview image, which is read back from the store.
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "64"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))  # seconds
+
+# Short names used in the download URLs handed out with each result
+ARTIFACT_ALIASES = {"image": "annotated.jpg", "face": "face.jpg"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verifications (
+    id TEXT PRIMARY KEY,
+    student_id TEXT,
+    created_at REAL NOT NULL,
+    result TEXT NOT NULL,
+    preview TEXT
+);
+CREATE INDEX IF NOT EXISTS verifications_student
+    ON verifications (student_id, created_at);
+CREATE INDEX IF NOT EXISTS verifications_created
+    ON verifications (created_at);
+CREATE TABLE IF NOT EXISTS artifacts (
+    verification_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (verification_id, name)
+);
+"""
+
+# Where an artifact's bytes live. Artifacts never change once written, so
+# the etag (derived from where they are) is a strong validator.
+ArtifactLocation = namedtuple("ArtifactLocation", "path offset length etag")
+
+# Ids and artifact names also name legacy folders and files; no "..", no "/"
+_SAFE_NAME = re.compile(r"^(?!\.+$)[A-Za-z0-9_.-]+$")
+
+
+class VerificationStore:
+    """
+    Saved verifications: result records in an indexed SQLite database and
+    their files (annotated image, face crop, text logs) appended to blob
+    segment files, so nothing is held in memory and nothing scans
+    directories.
+
+    Verifications saved before the store existed, one folder per id under
+    the results folder, can still have their files read.
+    """
+
+    def __init__(self, root=RESULTS_FOLDER, segment_max_mb=STORE_SEGMENT_MAX_MB):
+        self.root = root
+        self.segment_max_bytes = segment_max_mb * 1024 * 1024
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "index.sqlite3")
+        self._write_lock = threading.Lock()
+        self._local = threading.local()
+
+        self._db = self._connect()
+        self._db.executescript(SCHEMA)
+        row = self._db.execute("SELECT MAX(segment) FROM artifacts").fetchone()
+        self._segment_id = row[0] or 0
+        self._segment = open(self.segment_path(self._segment_id), "ab")
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        # WAL lets request threads read while the writer commits
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = self._connect()
+        return db
+
+    def segment_path(self, segment_id):
+        return os.path.join(self.root, f"blobs-{segment_id:05d}.seg")
+
+    def put_many(self, records, fsync=True):
+        """
+        Save [(verification_id, result, files)] where files maps artifact
+        names to bytes. Blobs are appended and synced before the index
+        rows are committed, so a crash can leave unreferenced bytes in a
+        segment but never a record pointing at missing data.
+        """
+        with self._write_lock:
+            rows, artifact_rows = [], []
+            for verification_id, result, files in records:
+                result = dict(result)
+                # The preview a client was sent is not kept; get() returns
+                # the saved annotated image in its place
+                result.pop("annotated_image_base64", None)
+                preview = "annotated.jpg" if "annotated.jpg" in files else None
+                for name, data in files.items():
+                    segment_id, offset = self._append(data, fsync)
+                    artifact_rows.append(
+                        (verification_id, name, segment_id, offset, len(data))
+                    )
+                rows.append(
+                    (
+                        verification_id,
+                        result.get("id_number"),
+                        time.time(),
+                        json.dumps(result),
+                        preview,
+                    )
+                )
+
+            self._segment.flush()
+            if fsync:
+                os.fsync(self._segment.fileno())
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO verifications VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?)",
+                    artifact_rows,
+                )
+
+    def _append(self, data, fsync=True):
+        if self._segment.tell() + len(data) > self.segment_max_bytes:
+            if self._segment.tell() > 0:
+                # Rows pointing into the old segment are committed with the
+                # rest of the batch, so it must be on disk before then
+                self._segment.flush()
+                if fsync:
+                    os.fsync(self._segment.fileno())
+                self._segment.close()
+                self._segment_id += 1
+                self._segment = open(self.segment_path(self._segment_id), "ab")
+        offset = self._segment.tell()
+        self._segment.write(data)
+        return self._segment_id, offset
+
+    def get(self, verification_id, include_preview=True):
+        """The result record for an id, or None"""
+        row = (
+            self._reader()
+            .execute(
+                "SELECT result, preview FROM verifications WHERE id = ?",
+                (verification_id,),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        result = json.loads(row[0])
+        if include_preview and row[1]:
+            self._attach_preview(result, self.read(verification_id, row[1]))
+        return result
+
+    def preview(self, verification_id):
+        """The saved preview image of a verification as JPEG bytes, or None"""
+        row = (
+            self._reader()
+            .execute(
+                "SELECT preview FROM verifications WHERE id = ?", (verification_id,)
+            )
+            .fetchone()
+        )
+        if row is None or not row[0]:
+            return None
+        return self.read(verification_id, row[0])
+
+    def with_preview(self, verification_id, result):
+        """A copy of a record shaped as get() returns it, preview included"""
+        result = dict(result)
+        self._attach_preview(result, self.preview(verification_id))
+        return result
+
+    @staticmethod
+    def _attach_preview(result, data):
+        if data is not None:
+            result["annotated_image_base64"] = base64.b64encode(data).decode("utf-8")
+
+    def find(self, student_id=None, since=None, until=None, limit=100):
+        """Records for a student and/or a created_at range, newest first"""
+        clauses, params = [], []
+        if student_id is not None:
+            clauses.append("student_id = ?")
+            params.append(student_id)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = (
+            self._reader()
+            .execute(
+                f"SELECT created_at, result FROM verifications {where} "
+                "ORDER BY created_at DESC LIMIT ?",
+                (*params, limit),
+            )
+            .fetchall()
+        )
+        return [
+            dict(json.loads(result), created_at=created_at)
+            for created_at, result in rows
+        ]
+
+    def locate(self, verification_id, name):
+        """
+        Where an artifact's bytes are, as an ArtifactLocation, or None.
+        name may be one of the URL aliases.
+        """
+        name = ARTIFACT_ALIASES.get(name, name)
+        if not (_SAFE_NAME.match(verification_id) and _SAFE_NAME.match(name)):
+            return None
+        row = (
+            self._reader()
+            .execute(
+                "SELECT segment, offset, length FROM artifacts "
+                "WHERE verification_id = ? AND name = ?",
+                (verification_id, name),
+            )
+            .fetchone()
+        )
+        if row is not None:
+            segment_id, offset, length = row
+            return ArtifactLocation(
+                self.segment_path(segment_id),
+                offset,
+                length,
+                f"{segment_id:x}-{offset:x}-{length:x}",
+            )
+
+        legacy_path = os.path.join(self.root, verification_id, name)
+        try:
+            stat = os.stat(legacy_path)
+        except OSError:
+            return None
+        return ArtifactLocation(
+            legacy_path, 0, stat.st_size, f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        )
+
+    def read(self, verification_id, name):
+        location = self.locate(verification_id, name)
+        if location is None:
+            return None
+        with BlobReader(location) as reader:
+            return reader.read()
+
+
+class BlobReader:
+    """
+    File-like view of one artifact (or a byte range of it) inside its
+    segment. It exposes fileno() and starts at the right file position, so
+    a server whose wsgi.file_wrapper uses sendfile can send it zero-copy.
+    """
+
+    def __init__(self, location, start=0, length=None):
+        if length is None:
+            length = location.length - start
+        self._file = open(location.path, "rb")
+        self._file.seek(location.offset + start)
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_size(result):
+    """Approximate bytes held by a result record, dominated by its strings"""
+    size = 0
+    for key, value in result.items():
+        if isinstance(value, str):
+            size += len(key) + len(value)
+        else:
+            size += len(key) + len(json.dumps(value, default=str))
+    return size
+
+
+class ResultCache:
+    """
+    LRU of result records bounded by entry count, total bytes and age.
+    Evicted records are simply read back from the store on the next miss.
+    """
+
+    def __init__(
+        self,
+        max_mb=RESULT_CACHE_MB,
+        max_entries=RESULT_CACHE_SIZE,
+        ttl=RESULT_CACHE_TTL,
+    ):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, verification_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(verification_id)
+            if entry is not None and now - entry[2] > self.ttl:
+                self._remove(verification_id)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(verification_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, verification_id, result):
+        size = record_size(result)
+        with self._lock:
+            self._remove(verification_id)
+            if size > self.max_bytes:
+                return
+            self._entries[verification_id] = (result, size, time.monotonic())
+            self._bytes += size
+            while (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, verification_id):
+        entry = self._entries.pop(verification_id, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None,
+            }
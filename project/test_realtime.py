@@ -3,8 +3,12 @@ import requests
 import time
 import numpy as np
 import base64
+import uuid
+from draw_utils import render_annotations
+from wire_format import client_accept_header, decode_body
 
 API_URL = "http://127.0.0.1:5000/verifications"
+SESSION_ID = str(uuid.uuid4())
 
 cap = cv2.VideoCapture(0)
 if not cap.isOpened():
@@ -32,16 +36,27 @@ while True:
         _, img_encoded = cv2.imencode(".jpg", frame)
         try:
             print("📤 Sending frame to API...")
-            response = requests.post(API_URL, files={"image": img_encoded.tobytes()})
+            response = requests.post(
+                API_URL,
+                files={"image": img_encoded.tobytes()},
+                data={"session_id": SESSION_ID, "annotate": "data"},
+                headers={"Accept": client_accept_header()},
+            )
             if response.status_code == 201:
-                data = response.json()
+                data, image_bytes = decode_body(
+                    response.headers.get("Content-Type"), response.content
+                )
 
-                # Decode annotated image from base64
+                # Decode the annotated image (only sent for saved
+                # verifications), otherwise draw the returned boxes locally
                 base64_str = data.get("annotated_image_base64")
-                if base64_str:
-                    decoded_bytes = base64.b64decode(base64_str)
-                    nparr = np.frombuffer(decoded_bytes, np.uint8)
+                if image_bytes is None and base64_str:
+                    image_bytes = base64.b64decode(base64_str)
+                if image_bytes:
+                    nparr = np.frombuffer(image_bytes, np.uint8)
                     annotated_image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                elif data.get("annotations"):
+                    annotated_image = render_annotations(frame, data["annotations"])
 
                 # Display extracted details
                 if data.get("all_labels_detected") == True:
@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import cv2
+
+# Encoded thumbnails default to JPEG; WebP is smaller but Excel cannot
+# embed it, so the Excel export always asks for JPEG
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "jpeg")  # jpeg | webp
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "85"))
+THUMBNAIL_CACHE_MB = float(os.getenv("THUMBNAIL_CACHE_MB", "16"))
+
+# (max width, max height) of each consumer
+EXCEL_SIZE = (240, 180)
+PREVIEW_SIZE = (800, 600)
+EMAIL_SIZE = (800, 600)
+
+ENCODINGS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+Thumbnail = namedtuple("Thumbnail", "data width height format")
+
+
+def fit_size(width, height, max_size, upscale=False):
+    """Largest (width, height) with the same aspect ratio inside max_size"""
+    ratio = min(max_size[0] / width, max_size[1] / height)
+    if ratio >= 1 and not upscale:
+        return width, height
+    return max(1, int(width * ratio)), max(1, int(height * ratio))
+
+
+def resize(image, max_size, upscale=False):
+    """Resize a BGR image to fit max_size, keeping its aspect ratio"""
+    return _resize_to(image, _output_size(image, max_size, upscale))
+
+
+def _output_size(image, max_size, upscale=False):
+    height, width = image.shape[:2]
+    return fit_size(width, height, max_size, upscale)
+
+
+def _resize_to(image, size):
+    height, width = image.shape[:2]
+    if size == (width, height):
+        return image
+    # INTER_AREA is the right filter for shrinking and far cheaper than
+    # converting to PIL for LANCZOS
+    interpolation = cv2.INTER_AREA if size[0] < width else cv2.INTER_LINEAR
+    return cv2.resize(image, size, interpolation=interpolation)
+
+
+class ThumbnailService:
+    """
+    Resized (and optionally encoded) copies of verification images, cached
+    by (key, output size, format) so each size is computed once per
+    verification however many consumers ask for it, whatever max_size and
+    upscale they asked with. Use the verification id as the key; key=None
+    skips the cache, e.g. for live camera frames.
+    """
+
+    def __init__(self, max_mb=THUMBNAIL_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def image(self, key, image, max_size, upscale=False):
+        """The resized BGR image"""
+        size = _output_size(image, max_size, upscale)
+        return self._cached((key, size, None), image)
+
+    def encoded(self, key, image, max_size, fmt=THUMBNAIL_FORMAT, quality=None):
+        """The resized image encoded as JPEG or WebP, as a Thumbnail"""
+        size = _output_size(image, max_size)
+        return self._cached((key, size, fmt, quality), image)
+
+    def _cached(self, cache_key, image):
+        if cache_key[0] is not None:
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None:
+                    self._entries.move_to_end(cache_key)
+                    return entry[0]
+
+        value = self._make(image, *cache_key[1:])
+        if cache_key[0] is None:
+            return value
+
+        size = len(value.data) if isinstance(value, Thumbnail) else value.nbytes
+        with self._lock:
+            if cache_key not in self._entries and size <= self.max_bytes:
+                self._entries[cache_key] = (value, size)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self._bytes -= evicted_size
+        return value
+
+    def _make(self, image, size, fmt, quality=None):
+        resized = _resize_to(image, size)
+        if fmt is None:
+            return resized
+        extension, quality_flag = ENCODINGS[fmt]
+        ok, buffer = cv2.imencode(
+            extension, resized, [quality_flag, quality or THUMBNAIL_QUALITY]
+        )
+        if not ok:
+            raise ValueError(f"Could not encode {fmt} thumbnail")
+        height, width = resized.shape[:2]
+        return Thumbnail(buffer.tobytes(), width, height, fmt)
+
+
+# Shared by the Excel logger and the GUI
+service = ThumbnailService()
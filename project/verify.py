@@ -1,241 +1,607 @@
-import cv2
-import torch
-import numpy as np
-import mediapipe as mp
-from facenet_pytorch import InceptionResnetV1
-from ultralytics import YOLO
-import torch.nn.functional as F
-import pytesseract
-import re
-from draw_utils import draw_bounding_box, class_colors
-
-# Set Tesseract path if necessary
-pytesseract.pytesseract.tesseract_cmd = r"C:/Program Files/Tesseract-OCR/tesseract.exe"
-
-# Setup device
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-# Initialize models
-facenet = InceptionResnetV1(pretrained="vggface2").eval().to(device)
-yolo_model = YOLO("models/best.pt")
-mp_face_detection = mp.solutions.face_detection
-face_detector = mp_face_detection.FaceDetection(min_detection_confidence=0.6)
-FACE_MATCH_THRESHOLD = 0.6
-
-
-def boxes_overlap(boxA, boxB):
-    ax, ay, aw, ah = boxA
-    bx, by, bw, bh = boxB
-    return not (ax + aw < bx or bx + bw < ax or ay + ah < by or by + bh < ay)
-
-
-def extract_text_from_bbox(image, bbox):
-    x1, y1, x2, y2 = bbox
-    roi = image[y1:y2, x1:x2]
-    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-    text = pytesseract.image_to_string(gray).strip()
-    return re.sub(r"[^a-zA-Z0-9\s]", "", text)
-
-
-def extract_face(frame, bbox):
-    x, y, w, h = bbox
-    face = frame[y : y + h, x : x + w]
-    if face.size == 0 or face.shape[0] < 10 or face.shape[1] < 10:
-        return None
-    try:
-        face = cv2.resize(face, (160, 160))
-    except cv2.error:
-        return None
-    face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
-    face = face.astype(np.float32) / 255.0
-    face = (face - 0.5) / 0.5
-    face = np.transpose(face, (2, 0, 1))
-    return torch.tensor(face).unsqueeze(0).to(device)
-
-
-def get_embedding(face_tensor):
-    with torch.no_grad():
-        return facenet(face_tensor)
-
-
-def compute_similarity(emb1, emb2):
-    return F.cosine_similarity(emb1, emb2).item()
-
-
-def verify_id_image(frame):
-    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    display_frame = frame.copy()
-
-    yolo_results = yolo_model(frame, imgsz=320, conf=0.5)[0]
-    boxes = yolo_results.boxes.xyxy.cpu().numpy()
-    classes = yolo_results.boxes.cls.cpu().numpy().astype(int)
-    detected_classes = set(classes)
-
-    if 1 in detected_classes:
-        for box, cls in zip(boxes, classes):
-            if cls == 1:
-                x1, y1, x2, y2 = map(int, box)
-                draw_bounding_box(
-                    display_frame,
-                    (x1, y1, x2 - x1, y2 - y1),
-                    "Please show valid ID",
-                    class_colors[1],
-                )
-        return display_frame, {"error": "Other ID detected"}
-
-    logo_found = 6 in detected_classes
-    pattern_count = sum(1 for c in classes if c == 5)
-    uts_id_bbox = None
-    id_number_text, first_name_text, last_name_text = "", "", ""
-
-    for box, cls in zip(boxes, classes):
-        x1, y1, x2, y2 = map(int, box)
-        w, h = x2 - x1, y2 - y1
-        label = ""
-        color = class_colors.get(cls, (255, 255, 255))
-
-        if cls == 0:
-            label = "UTS ID"
-            uts_id_bbox = (x1, y1, w, h)
-        elif cls == 2:
-            label = "ID Number"
-            id_number_text = extract_text_from_bbox(frame, (x1, y1, x2, y2))
-            label += f": {id_number_text}"
-        elif cls == 3:
-            label = "First Name"
-            first_name_text = extract_text_from_bbox(frame, (x1, y1, x2, y2))
-            label += f": {first_name_text}"
-        elif cls == 4:
-            label = "Last Name"
-            last_name_text = extract_text_from_bbox(frame, (x1, y1, x2, y2))
-            label += f": {last_name_text}"
-        elif cls == 5:
-            label = "Pattern"
-        elif cls == 6:
-            label = "Logo"
-
-        if label:
-            draw_bounding_box(display_frame, (x1, y1, w, h), label, color)
-
-    real_face_bbox = None
-    id_face_bbox = None
-
-    if uts_id_bbox is not None:
-        x, y, w, h = uts_id_bbox
-        id_crop = frame[y : y + h, x : x + w]
-        id_crop_rgb = cv2.cvtColor(id_crop, cv2.COLOR_BGR2RGB)
-        id_result = face_detector.process(id_crop_rgb)
-        if id_result.detections:
-            ih, iw, _ = id_crop.shape
-            bboxC = id_result.detections[0].location_data.relative_bounding_box
-            fx = int(bboxC.xmin * iw)
-            fy = int(bboxC.ymin * ih)
-            fw = int(bboxC.width * iw)
-            fh = int(bboxC.height * ih)
-            if fw > 0 and fh > 0:
-                id_face_bbox = (x + fx, y + fy, fw, fh)
-
-    results = face_detector.process(frame_rgb)
-    ih, iw, _ = frame.shape
-    if results.detections:
-        for detection in results.detections:
-            bboxC = detection.location_data.relative_bounding_box
-            x = int(bboxC.xmin * iw)
-            y = int(bboxC.ymin * ih)
-            w = int(bboxC.width * iw)
-            h = int(bboxC.height * ih)
-            if uts_id_bbox is None or not boxes_overlap((x, y, w, h), uts_id_bbox):
-                real_face_bbox = (x, y, w, h)
-                break
-
-    face_match_result = "incomplete"
-    face_match_exist = False
-    if real_face_bbox and id_face_bbox:
-        face1_tensor = extract_face(frame, real_face_bbox)
-        face2_tensor = extract_face(frame, id_face_bbox)
-        if face1_tensor is not None and face2_tensor is not None:
-            emb1 = get_embedding(face1_tensor)
-            emb2 = get_embedding(face2_tensor)
-            similarity = compute_similarity(emb1, emb2)
-            match_text = "match" if similarity > FACE_MATCH_THRESHOLD else "no match"
-            face_match_result = match_text
-            face_match_exist = True
-            color = (0, 255, 0) if similarity > FACE_MATCH_THRESHOLD else (0, 0, 255)
-            draw_bounding_box(display_frame, real_face_bbox, match_text, color)
-            draw_bounding_box(display_frame, id_face_bbox, match_text, color)
-    elif real_face_bbox:
-        draw_bounding_box(display_frame, real_face_bbox, "Need ID face", (0, 165, 255))
-    elif id_face_bbox:
-        draw_bounding_box(display_frame, id_face_bbox, "Need real face", (0, 165, 255))
-
-    summary_text = (
-        f"Logo: {'Yes' if logo_found else 'No'}, Pattern: {pattern_count} Found"
-    )
-    summary_color = (
-        (0, 255, 0)
-        if pattern_count >= 2
-        else (0, 255, 255) if pattern_count == 1 else (0, 0, 255)
-    )
-    cv2.putText(
-        display_frame,
-        summary_text,
-        (10, 30),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        0.7,
-        summary_color,
-        2,
-    )
-
-    # Check if all labels are detected (logo, pattern, face match, face present)
-    # Also the labels for id_num, fisrt and last name can not be null
-    # Determine label detection status
-    all_labels_detected = (
-        logo_found
-        and pattern_count >= 1
-        and face_match_exist == True
-        and real_face_bbox is not None
-        and id_number_text.strip() != ""
-        and first_name_text.strip() != ""
-        and last_name_text.strip() != ""
-    )
-
-    # Determine if verification passes all strict criteria
-    verification_valid = (
-        face_match_result == "match" and logo_found and pattern_count == 2
-    )
-
-    # Collect failure reasons (for retry feedback)
-    failure_reasons = []
-    if face_match_result != "match":
-        failure_reasons.append("Face does not match")
-
-    if pattern_count < 2:
-        failure_reasons.append("Less than 2 patterns found")
-
-    # Extract cropped face image from real_face_bbox if available
-    # we want to save this to the databasae so next time, if
-    # someone is checked and already saved in the database
-    # the system would check that frame, and see if they have been
-    # checked by comparing information and face
-
-    face_crop = None
-    if real_face_bbox:
-        x, y, w, h = real_face_bbox
-        face_crop = frame[y : y + h, x : x + w]
-
-    # Return result
-    return (
-        {
-            "id_number": id_number_text,
-            "first_name": first_name_text,
-            "last_name": last_name_text,
-            "logo_found": logo_found,
-            "pattern_count": pattern_count,
-            "face_match_result": face_match_result,
-            "all_labels_detected": all_labels_detected,
-            "verification_valid": verification_valid,
-            "failure_reasons": failure_reasons,
-        },
-        display_frame,
-        face_crop,
-    )
+import os
+import cv2
+import torch
+import numpy as np
+import torch.nn.functional as F
+from draw_utils import (
+    box_annotation,
+    class_colors,
+    render_annotations,
+    text_annotation,
+)
+from model_registry import ModelRegistry
+from embedding import EMBEDDING_BACKEND, load_embedder
+from detector import DETECTOR_BACKEND, DETECTOR_IMGSZ, load_detector
+from ocr import clean_text, read_cached, submit_fields
+from motion import MotionGate
+from gallery import FaceGallery
+
+# Setup device
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+FACE_MATCH_THRESHOLD = 0.6
+
+# YOLO classes whose boxes are read with OCR, and their display labels
+OCR_FIELDS = {2: "ID Number", 3: "First Name", 4: "Last Name"}
+
+# Match returning students against their enrolled embedding when the card
+# photo cannot be compared, and propose enrolling students after a valid
+# verification; the enrolment is written once they pass the OTP step
+GALLERY_MATCH = os.getenv("GALLERY_MATCH", "1") == "1"
+GALLERY_ENROLL = os.getenv("GALLERY_ENROLL", "1") == "1"
+GALLERY_TOP_K = 3
+
+# ID-photo faces found by the full-frame pass with a shorter side below this
+# many pixels are re-detected on the card crop
+MIN_ID_FACE_SIZE = int(os.getenv("MIN_ID_FACE_SIZE", "40"))
+
+# Early exits checked right after YOLO. A frame that hits one skips OCR,
+# face detection and FaceNet. The optional ones drop frames that could
+# still set all_labels_detected or verification_valid.
+# no_uts_id is also what keeps the gallery path safe: without a card box
+# every face counts as live, so a gallery match could accept the printed
+# card photo as the live face and set verification_valid. Do not drop it
+# from EARLY_EXITS while GALLERY_MATCH is on.
+EARLY_EXIT_RULES = {
+    "no_uts_id": lambda layout: layout["uts_id_bbox"] is None,
+    "no_logo": lambda layout: not layout["logo_found"],
+    "no_pattern": lambda layout: layout["pattern_count"] == 0,
+    "few_patterns": lambda layout: layout["pattern_count"] < 2,
+    "missing_text_fields": lambda layout: {cls for cls, _ in layout["ocr_boxes"]}
+    != set(OCR_FIELDS),
+}
+EARLY_EXITS = [
+    rule.strip()
+    for rule in os.getenv("EARLY_EXITS", "no_uts_id,no_logo,no_pattern").split(",")
+    if rule.strip()
+]
+_unknown_rules = set(EARLY_EXITS) - set(EARLY_EXIT_RULES)
+if _unknown_rules:
+    raise ValueError(
+        f"Unknown EARLY_EXITS rule(s): {', '.join(sorted(_unknown_rules))}. "
+        f"Choose from: {', '.join(EARLY_EXIT_RULES)}"
+    )
+
+
+# Models are loaded on first use (or by registry.warm_up) so importing this
+# module stays cheap
+def _load_facenet():
+    return load_embedder(EMBEDDING_BACKEND, device)
+
+
+def _load_yolo():
+    return load_detector(DETECTOR_BACKEND)
+
+
+def _load_face_detector():
+    import mediapipe as mp
+
+    return mp.solutions.face_detection.FaceDetection(min_detection_confidence=0.6)
+
+
+# Ultralytics predictors and MediaPipe graphs keep per-call state, so with
+# several inference threads each thread gets its own copy
+registry = ModelRegistry()
+registry.register("facenet", _load_facenet)
+registry.register("yolo", _load_yolo, per_thread=True)
+registry.register("face_detector", _load_face_detector, per_thread=True)
+
+
+def warm_up_models():
+    """Load every model in the calling thread (and process)"""
+    return registry.warm_up()
+
+# Reuses detections for live-stream sessions whose scene has not changed
+motion_gate = MotionGate()
+
+# Inference worker processes (workers.py) read the gallery but leave writing
+# it to the server process
+gallery = FaceGallery(read_only=os.getenv("GALLERY_READ_ONLY", "0") == "1")
+
+
+def boxes_overlap(boxA, boxB):
+    ax, ay, aw, ah = boxA
+    bx, by, bw, bh = boxB
+    return not (ax + aw < bx or bx + bw < ax or ay + ah < by or by + bh < ay)
+
+
+def _gray_roi(image, bbox):
+    x1, y1, x2, y2 = bbox
+    roi = image[y1:y2, x1:x2]
+    return cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+
+
+def extract_text_from_bbox(image, bbox, field=None):
+    return clean_text(read_cached(_gray_roi(image, bbox), field))
+
+
+def start_text_extraction(image, bboxes, fields=None, source=None):
+    # Returns Futures; the caller joins them once the face stages are done.
+    # With a reduced-scale upload as source, the text is read from the
+    # full-resolution image instead.
+    loaders = None
+    if source is not None and source.scale != 1:
+        loaders = [
+            lambda bbox=bbox: cv2.cvtColor(source.full_roi(bbox), cv2.COLOR_BGR2GRAY)
+            for bbox in bboxes
+        ]
+    return submit_fields([_gray_roi(image, bbox) for bbox in bboxes], fields, loaders)
+
+
+def extract_face(frame, bbox):
+    x, y, w, h = bbox
+    face = frame[y : y + h, x : x + w]
+    if face.size == 0 or face.shape[0] < 10 or face.shape[1] < 10:
+        return None
+    try:
+        face = cv2.resize(face, (160, 160))
+    except cv2.error:
+        return None
+    face = cv2.cvtColor(face, cv2.COLOR_BGR2RGB)
+    face = face.astype(np.float32) / 255.0
+    face = (face - 0.5) / 0.5
+    face = np.transpose(face, (2, 0, 1))
+    return torch.tensor(face).unsqueeze(0).to(device)
+
+
+def get_embedding(face_tensor):
+    with torch.no_grad():
+        return registry.get("facenet")(face_tensor)
+
+
+def compute_similarity(emb1, emb2):
+    return F.cosine_similarity(emb1, emb2).item()
+
+
+def _relative_to_pixels(detection, width, height):
+    bboxC = detection.location_data.relative_bounding_box
+    return (
+        int(bboxC.xmin * width),
+        int(bboxC.ymin * height),
+        int(bboxC.width * width),
+        int(bboxC.height * height),
+    )
+
+
+def _centre_inside(bbox, container):
+    x, y, w, h = bbox
+    cx, cy, cw, ch = container
+    centre_x, centre_y = x + w / 2, y + h / 2
+    return cx <= centre_x <= cx + cw and cy <= centre_y <= cy + ch
+
+
+def _detect_faces(frame, uts_id_bbox):
+    # One MediaPipe pass over the whole frame: faces centred inside the card
+    # are ID-photo faces, faces clear of it are live faces
+    face_detector = registry.get("face_detector")
+    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    ih, iw, _ = frame.shape
+    real_face_bbox = None
+    id_face_bbox = None
+
+    results = face_detector.process(frame_rgb)
+    for detection in results.detections or []:
+        bbox = _relative_to_pixels(detection, iw, ih)
+        if bbox[2] <= 0 or bbox[3] <= 0:
+            continue
+        if uts_id_bbox is not None and _centre_inside(bbox, uts_id_bbox):
+            if id_face_bbox is None:
+                id_face_bbox = bbox
+        elif uts_id_bbox is None or not boxes_overlap(bbox, uts_id_bbox):
+            if real_face_bbox is None:
+                real_face_bbox = bbox
+
+    # The card photo is often too small for the full-frame pass, so only
+    # then re-detect on the card crop, where it fills more of the input
+    if uts_id_bbox is not None and (
+        id_face_bbox is None or min(id_face_bbox[2:]) < MIN_ID_FACE_SIZE
+    ):
+        x, y, w, h = uts_id_bbox
+        # MediaPipe needs a contiguous buffer; a slice copy is cheaper than
+        # converting the crop again
+        id_crop_rgb = np.ascontiguousarray(frame_rgb[y : y + h, x : x + w])
+        if id_crop_rgb.size:
+            id_result = face_detector.process(id_crop_rgb)
+            if id_result.detections:
+                ih, iw, _ = id_crop_rgb.shape
+                fx, fy, fw, fh = _relative_to_pixels(id_result.detections[0], iw, ih)
+                if fw > 0 and fh > 0:
+                    id_face_bbox = (x + fx, y + fy, fw, fh)
+
+    return real_face_bbox, id_face_bbox
+
+
+def early_exit_reason(layout, rules=None):
+    """Return the first configured early-exit rule the frame layout hits"""
+    for rule in EARLY_EXITS if rules is None else rules:
+        if EARLY_EXIT_RULES[rule](layout):
+            return rule
+    return None
+
+
+def _inspect_frame(frame, boxes, classes, faces=None, source=None):
+    # faces is (real_face_bbox, id_face_bbox) when reusing an earlier frame.
+    # Boxes and labels are collected as annotations and only drawn on a copy
+    # of the frame when the caller asks for an image.
+    annotations = []
+    detected_classes = set(classes)
+
+    if 1 in detected_classes:
+        for box, cls in zip(boxes, classes):
+            if cls == 1:
+                x1, y1, x2, y2 = map(int, box)
+                annotations.append(
+                    box_annotation(
+                        (x1, y1, x2 - x1, y2 - y1),
+                        "Please show valid ID",
+                        class_colors[1],
+                        cls,
+                    )
+                )
+        return {
+            "other_id": True,
+            "frame": frame,
+            "source": source,
+            "annotations": annotations,
+            "detections": {"boxes": boxes, "classes": classes, "faces": None},
+        }
+
+    logo_found = 6 in detected_classes
+    pattern_count = sum(1 for c in classes if c == 5)
+    uts_id_bbox = None
+    ocr_boxes = []
+
+    for box, cls in zip(boxes, classes):
+        x1, y1, x2, y2 = map(int, box)
+        w, h = x2 - x1, y2 - y1
+        label = ""
+        color = class_colors.get(cls, (255, 255, 255))
+
+        if cls == 0:
+            label = "UTS ID"
+            uts_id_bbox = (x1, y1, w, h)
+        elif cls in OCR_FIELDS:
+            # Read in the background while the face stages run
+            ocr_boxes.append((cls, (x1, y1, x2, y2)))
+        elif cls == 5:
+            label = "Pattern"
+        elif cls == 6:
+            label = "Logo"
+
+        if label:
+            annotations.append(box_annotation((x1, y1, w, h), label, color, cls))
+
+    state = {
+        "other_id": False,
+        "frame": frame,
+        "source": source,
+        "annotations": annotations,
+        "logo_found": logo_found,
+        "pattern_count": pattern_count,
+        "uts_id_bbox": uts_id_bbox,
+        "ocr_boxes": ocr_boxes,
+        "ocr_jobs": [],
+        "real_face_bbox": None,
+        "id_face_bbox": None,
+        "live_tensor": None,
+        "id_tensor": None,
+        "live_embedding": None,
+        "id_embedding": None,
+        "gallery_matches": [],
+        "early_exit": None,
+        "detections": {"boxes": boxes, "classes": classes, "faces": faces},
+    }
+
+    # Stop before the expensive stages if this frame cannot pass
+    state["early_exit"] = early_exit_reason(state)
+    if state["early_exit"] is not None:
+        return state
+
+    ocr_futures = start_text_extraction(
+        frame,
+        [bbox for _, bbox in ocr_boxes],
+        [cls for cls, _ in ocr_boxes],
+        source,
+    )
+    ocr_jobs = [
+        (cls, bbox, future) for (cls, bbox), future in zip(ocr_boxes, ocr_futures)
+    ]
+
+    if faces is None:
+        faces = _detect_faces(frame, uts_id_bbox)
+    real_face_bbox, id_face_bbox = faces
+
+    # Face tensors are only extracted here; the embeddings for every frame
+    # in the batch are computed together in verify_id_images. A live face on
+    # its own is only worth embedding when the gallery can be searched.
+    live_tensor = None
+    id_tensor = None
+    if real_face_bbox and id_face_bbox:
+        live_tensor = extract_face(frame, real_face_bbox)
+        id_tensor = extract_face(frame, id_face_bbox)
+        if live_tensor is None or id_tensor is None:
+            live_tensor = id_tensor = None
+    if real_face_bbox and live_tensor is None and len(gallery):
+        live_tensor = extract_face(frame, real_face_bbox)
+
+    state.update(
+        {
+            "ocr_jobs": ocr_jobs,
+            "real_face_bbox": real_face_bbox,
+            "id_face_bbox": id_face_bbox,
+            "live_tensor": live_tensor,
+            "id_tensor": id_tensor,
+            "detections": {"boxes": boxes, "classes": classes, "faces": faces},
+        }
+    )
+    return state
+
+
+def _to_upload_scale(annotations, source):
+    """
+    Boxes are found on the reduced-scale frame; map them back onto the
+    image the client uploaded. Text overlays keep their fixed position.
+    """
+    if source is None or source.scale == 1:
+        return annotations
+    scaled = []
+    for annotation in annotations:
+        if annotation["type"] == "box":
+            annotation = dict(
+                annotation, box=[v * source.scale for v in annotation["box"]]
+            )
+        scaled.append(annotation)
+    return scaled
+
+
+def _build_result(state, render=True):
+    # The preview and face crop come from the reduced frame the detectors
+    # saw; the returned boxes are in the uploaded image's coordinates, so
+    # callers that save a verification can redo both at full resolution
+    frame = state["frame"]
+    source = state["source"]
+    annotations = state["annotations"]
+    if state["other_id"]:
+        display_frame = render_annotations(frame, annotations) if render else None
+        annotations = _to_upload_scale(annotations, source)
+        return display_frame, {"error": "Other ID detected", "annotations": annotations}
+
+    logo_found = state["logo_found"]
+    pattern_count = state["pattern_count"]
+    real_face_bbox = state["real_face_bbox"]
+    id_face_bbox = state["id_face_bbox"]
+    live_embedding = state["live_embedding"]
+    id_embedding = state["id_embedding"]
+
+    # Join the OCR started in _inspect_frame
+    field_texts = {}
+    for cls, (x1, y1, x2, y2), future in state["ocr_jobs"]:
+        text = clean_text(future.result())
+        field_texts[cls] = text
+        annotations.append(
+            box_annotation(
+                (x1, y1, x2 - x1, y2 - y1),
+                f"{OCR_FIELDS[cls]}: {text}",
+                class_colors[cls],
+                cls,
+            )
+        )
+    id_number_text = field_texts.get(2, "")
+    first_name_text = field_texts.get(3, "")
+    last_name_text = field_texts.get(4, "")
+
+    # Compare with the card photo, or with the enrolled face of the student
+    # whose ID number was read when the card photo is not usable
+    similarity = None
+    face_match_source = None
+    if live_embedding is not None and id_embedding is not None:
+        similarity = compute_similarity(live_embedding, id_embedding)
+        face_match_source = "id_photo"
+    elif live_embedding is not None and GALLERY_MATCH and id_number_text:
+        enrolled = gallery.get(id_number_text.strip())
+        if enrolled is not None:
+            similarity = compute_similarity(
+                live_embedding, torch.from_numpy(enrolled).unsqueeze(0)
+            )
+            face_match_source = "gallery"
+
+    # Enrolled students other than the one on the card who match this face
+    identity_conflicts = [
+        enrolled_id
+        for enrolled_id, score in state["gallery_matches"]
+        if score > FACE_MATCH_THRESHOLD and enrolled_id != id_number_text.strip()
+    ]
+
+    face_match_result = "incomplete"
+    face_match_exist = False
+    if similarity is not None:
+        match_text = "match" if similarity > FACE_MATCH_THRESHOLD else "no match"
+        face_match_result = match_text
+        face_match_exist = True
+        color = (0, 255, 0) if similarity > FACE_MATCH_THRESHOLD else (0, 0, 255)
+        annotations.append(box_annotation(real_face_bbox, match_text, color))
+        if id_face_bbox:
+            annotations.append(box_annotation(id_face_bbox, match_text, color))
+    elif real_face_bbox and not id_face_bbox:
+        annotations.append(
+            box_annotation(real_face_bbox, "Need ID face", (0, 165, 255))
+        )
+    elif id_face_bbox and not real_face_bbox:
+        annotations.append(
+            box_annotation(id_face_bbox, "Need real face", (0, 165, 255))
+        )
+
+    summary_text = (
+        f"Logo: {'Yes' if logo_found else 'No'}, Pattern: {pattern_count} Found"
+    )
+    summary_color = (
+        (0, 255, 0)
+        if pattern_count >= 2
+        else (0, 255, 255) if pattern_count == 1 else (0, 0, 255)
+    )
+    annotations.append(text_annotation(summary_text, (10, 30), summary_color))
+
+    # Check if all labels are detected (logo, pattern, face match, face present)
+    # Also the labels for id_num, fisrt and last name can not be null
+    # Determine label detection status
+    all_labels_detected = (
+        logo_found
+        and pattern_count >= 1
+        and face_match_exist == True
+        and real_face_bbox is not None
+        and id_number_text.strip() != ""
+        and first_name_text.strip() != ""
+        and last_name_text.strip() != ""
+    )
+
+    # Determine if verification passes all strict criteria
+    verification_valid = (
+        face_match_result == "match" and logo_found and pattern_count == 2
+    )
+
+    # Collect failure reasons (for retry feedback)
+    failure_reasons = []
+    if face_match_result != "match":
+        failure_reasons.append("Face does not match")
+
+    if pattern_count < 2:
+        failure_reasons.append("Less than 2 patterns found")
+
+    # Propose the face after a verification against the card photo; it is
+    # enrolled once the student passes the OTP step, so next time they can
+    # be recognised from the gallery
+    if (
+        GALLERY_ENROLL
+        and verification_valid
+        and all_labels_detected
+        and face_match_source == "id_photo"
+    ):
+        gallery.propose(id_number_text.strip(), live_embedding.numpy())
+
+    face_crop = None
+    face_bbox = None
+    if real_face_bbox:
+        x, y, w, h = real_face_bbox
+        face_crop = frame[y : y + h, x : x + w]
+        scale = 1 if source is None else source.scale
+        face_bbox = [v * scale for v in real_face_bbox]
+    display_frame = render_annotations(frame, annotations) if render else None
+
+    # Return result
+    return (
+        {
+            "id_number": id_number_text,
+            "first_name": first_name_text,
+            "last_name": last_name_text,
+            "logo_found": logo_found,
+            "pattern_count": pattern_count,
+            "face_match_result": face_match_result,
+            "all_labels_detected": all_labels_detected,
+            "verification_valid": verification_valid,
+            "failure_reasons": failure_reasons,
+            "detections_reused": state["detections_reused"],
+            "early_exit": state["early_exit"],
+            "face_match_source": face_match_source,
+            "identity_conflicts": identity_conflicts,
+            "face_bbox": face_bbox,
+            "annotations": _to_upload_scale(annotations, source),
+        },
+        display_frame,
+        face_crop,
+    )
+
+
+def verify_id_images(frames, session_ids=None, render=True, sources=None):
+    """
+    Verify a batch of frames. YOLO runs once over the whole batch and every
+    extracted face goes through a single FaceNet forward pass. Returns one
+    result per frame, in the same shape as verify_id_image.
+
+    render (a bool, or one per frame) controls whether the annotated image
+    is drawn. Without it the image slot is None and the boxes and labels
+    are only returned as data in result["annotations"].
+
+    sources optionally gives the ingest.Upload each frame was decoded from,
+    so OCR can read text fields at full resolution.
+
+    Frames tagged with a session ID go through the motion gate first: if the
+    scene has not changed since that session's last full inference, its
+    YOLO and face boxes are reused instead of running the detectors again.
+    """
+    frames = list(frames)
+    if not frames:
+        return []
+    session_ids = session_ids or [None] * len(frames)
+    if isinstance(render, bool):
+        render = [render] * len(frames)
+    sources = sources or [None] * len(frames)
+
+    reused = [None] * len(frames)
+    signatures = [None] * len(frames)
+    for i, (frame, session_id) in enumerate(zip(frames, session_ids)):
+        if session_id is not None:
+            signatures[i], reused[i] = motion_gate.check(session_id, frame)
+
+    to_detect = [i for i, detections in enumerate(reused) if detections is None]
+    yolo_batch = []
+    if to_detect:
+        yolo_batch = registry.get("yolo")(
+            [frames[i] for i in to_detect], imgsz=DETECTOR_IMGSZ, conf=0.5
+        )
+    yolo_by_frame = dict(zip(to_detect, yolo_batch))
+
+    states = []
+    for i, frame in enumerate(frames):
+        if reused[i] is not None:
+            detections = reused[i]
+            state = _inspect_frame(
+                frame,
+                detections["boxes"],
+                detections["classes"],
+                detections["faces"],
+                sources[i],
+            )
+        else:
+            yolo_results = yolo_by_frame[i]
+            state = _inspect_frame(
+                frame,
+                yolo_results.boxes.xyxy.cpu().numpy(),
+                yolo_results.boxes.cls.cpu().numpy().astype(int),
+                source=sources[i],
+            )
+            if session_ids[i] is not None:
+                motion_gate.store(
+                    session_ids[i], frame, signatures[i], state["detections"]
+                )
+        state["detections_reused"] = reused[i] is not None
+        states.append(state)
+
+    # One FaceNet pass for every live face and ID face in the batch
+    owners = [
+        (state, kind)
+        for state in states
+        for kind in ("live", "id")
+        if state.get(f"{kind}_tensor") is not None
+    ]
+    if owners:
+        batch = torch.cat([state[f"{kind}_tensor"] for state, kind in owners])
+        embeddings = get_embedding(batch).cpu()
+        for row, (state, kind) in enumerate(owners):
+            state[f"{kind}_embedding"] = embeddings[row : row + 1]
+
+    # One gallery search for every live face in the batch
+    live_states = [state for state in states if state.get("live_embedding") is not None]
+    if live_states and len(gallery):
+        queries = torch.cat([state["live_embedding"] for state in live_states])
+        matches = gallery.lookup(queries.numpy(), k=GALLERY_TOP_K)
+        for state, state_matches in zip(live_states, matches):
+            state["gallery_matches"] = state_matches
+
+    return [
+        _build_result(state, frame_render)
+        for state, frame_render in zip(states, render)
+    ]
+
+
+def verify_id_image(frame, render=True):
+    return verify_id_images([frame], render=render)[0]
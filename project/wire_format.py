@@ -0,0 +1,106 @@
+import json
+import os
+import uuid
+from email.parser import BytesParser
+
+import cv2
+
+try:
+    import msgpack
+except ImportError:  # msgpack responses are simply not offered without it
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MULTIPART = "multipart/mixed"
+
+# Preview image sent back with each verification response
+PREVIEW_JPEG_QUALITY = int(os.getenv("PREVIEW_JPEG_QUALITY", "80"))
+PREVIEW_SCALE = float(os.getenv("PREVIEW_SCALE", "1.0"))
+
+
+def supported_formats():
+    # JSON first so clients that accept anything keep getting JSON
+    formats = [JSON, MULTIPART]
+    if msgpack is not None:
+        formats.insert(1, MSGPACK)
+    return formats
+
+
+def client_accept_header():
+    """Accept header for clients that can read the binary formats"""
+    if msgpack is not None:
+        return f"{MSGPACK}, {MULTIPART};q=0.9, {JSON};q=0.5"
+    return f"{MULTIPART}, {JSON};q=0.5"
+
+
+def encode_preview(image, quality=PREVIEW_JPEG_QUALITY, scale=PREVIEW_SCALE):
+    """JPEG-encode the preview image, optionally downscaled first"""
+    if 0 < scale < 1:
+        h, w = image.shape[:2]
+        image = cv2.resize(
+            image,
+            (max(1, int(w * scale)), max(1, int(h * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        return None
+    return buffer.tobytes()
+
+
+def encode_body(result, image_bytes, response_format):
+    """
+    Serialise a verification result and its raw JPEG preview.
+    Returns (body, content_type). JSON callers attach the base64 image to
+    the result themselves, as before.
+    """
+    if response_format == MSGPACK:
+        payload = dict(result)
+        payload["annotated_image"] = image_bytes
+        return msgpack.packb(payload, use_bin_type=True), MSGPACK
+
+    if response_format == MULTIPART:
+        boundary = uuid.uuid4().hex
+        parts = [
+            f"--{boundary}\r\nContent-Type: {JSON}\r\n\r\n".encode()
+            + json.dumps(result).encode()
+            + b"\r\n"
+        ]
+        if image_bytes is not None:
+            parts.append(
+                f"--{boundary}\r\nContent-Type: image/jpeg\r\n"
+                'Content-Disposition: attachment; name="annotated_image"\r\n\r\n'.encode()
+                + image_bytes
+                + b"\r\n"
+            )
+        parts.append(f"--{boundary}--\r\n".encode())
+        return b"".join(parts), f"{MULTIPART}; boundary={boundary}"
+
+    return json.dumps(result).encode(), JSON
+
+
+def decode_body(content_type, body):
+    """
+    Client side of encode_body. Returns (result, image_bytes); image_bytes
+    is None when the server sent no preview or sent it as base64 JSON.
+    """
+    content_type = content_type or JSON
+    if content_type.startswith(MSGPACK):
+        payload = msgpack.unpackb(body, raw=False)
+        return payload, payload.pop("annotated_image", None)
+
+    if content_type.startswith(MULTIPART):
+        message = BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        result, image_bytes = {}, None
+        for part in message.get_payload():
+            payload = part.get_payload(decode=True)
+            if part.get_content_type() == JSON:
+                result = json.loads(payload)
+            elif part.get_content_type() == "image/jpeg":
+                image_bytes = payload
+        return result, image_bytes
+
+    return json.loads(body), None
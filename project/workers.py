@@ -0,0 +1,242 @@
+import contextlib
+import os
+import queue
+import threading
+import zlib
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+# Threads each inference process may use for PyTorch, OpenCV and
+# onnxruntime. The default splits the cores evenly between the workers so
+# they do not oversubscribe the machine.
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "0"))
+# Pin each worker to its own block of WORKER_THREADS cores (Linux only)
+WORKER_PIN_CPUS = os.getenv("WORKER_PIN_CPUS", "0") == "1"
+# Shared-memory arena per worker for handing over a batch of decoded frames
+# and their JPEG buffers. Batches that do not fit are pickled instead.
+WORKER_SHM_MB = int(os.getenv("WORKER_SHM_MB", "64"))
+
+ALIGNMENT = 64
+
+
+def default_threads(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _attach(name):
+    # The server process owns the segment; the worker must not unlink it
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        from multiprocessing import resource_tracker
+
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class _Arena:
+    """Packs arrays back to back into one shared-memory segment"""
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.offset = 0
+
+    def put(self, array):
+        array = np.ascontiguousarray(array)
+        start = -(-self.offset // ALIGNMENT) * ALIGNMENT
+        end = start + array.nbytes
+        if end > self.shm.size:
+            return ("inline", array)
+        view = np.ndarray(array.shape, array.dtype, buffer=self.shm.buf, offset=start)
+        view[...] = array
+        self.offset = end
+        return ("shm", start, array.shape, array.dtype.str)
+
+    def get(self, spec):
+        if spec[0] == "inline":
+            return spec[1]
+        _, start, shape, dtype = spec
+        return np.ndarray(shape, np.dtype(dtype), buffer=self.shm.buf, offset=start)
+
+
+@contextlib.contextmanager
+def _worker_environment(threads):
+    # A spawned worker re-imports the server's main module (and with it
+    # verify, torch and onnxruntime) before _worker_main runs, so settings
+    # read on import must already be in the environment it inherits
+    names = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "ONNX_THREADS")
+    settings = dict.fromkeys(names, str(threads))
+    settings["GALLERY_READ_ONLY"] = "1"
+    saved = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _configure_threads(index, threads):
+    if WORKER_PIN_CPUS and hasattr(os, "sched_setaffinity"):
+        cpus = os.cpu_count() or 1
+        first = (index * threads) % cpus
+        os.sched_setaffinity(0, {(first + i) % cpus for i in range(threads)})
+
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+    cv2.setNumThreads(threads)
+
+
+def _worker_main(index, threads, shm_name, requests, replies, ready, warm_up):
+    _configure_threads(index, threads)
+
+    import verify
+    from ingest import Upload
+
+    shm = _attach(shm_name)
+    arena = _Arena(shm)
+    if warm_up:
+        verify.warm_up_models()
+    ready.set()
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        frame_specs, source_specs, session_ids, render = message
+        try:
+            frames = [arena.get(spec) for spec in frame_specs]
+            sources = [
+                (
+                    None
+                    if spec is None
+                    else Upload.from_parts(arena.get(spec[0]), frame, spec[1])
+                )
+                for frame, spec in zip(frames, source_specs)
+            ]
+            results = verify.verify_id_images(frames, session_ids, render, sources)
+            replies.put(("ok", results, verify.gallery.take_pending()))
+        except Exception as e:
+            replies.put(("error", f"{type(e).__name__}: {e}", []))
+        finally:
+            # Drop every view of the arena before the next batch overwrites it
+            frames = sources = None
+    shm.close()
+
+
+class WorkerPool:
+    """
+    Inference worker processes, each with its own YOLO, FaceNet and
+    MediaPipe instances and a pinned number of threads.
+
+    Each worker runs one batch at a time. The caller picks the worker, so a
+    live-stream session can be kept on the same process and its motion gate.
+    Decoded frames and JPEG buffers are copied into the worker's
+    shared-memory arena and read there without pickling; results come back
+    through a queue. Gallery enrolments proposed in a worker are returned
+    with the results and held by this process, the only gallery writer.
+    """
+
+    def __init__(self, workers, threads=WORKER_THREADS, shm_mb=WORKER_SHM_MB):
+        self.workers = max(1, workers)
+        self.threads = threads or default_threads(self.workers)
+        self.shm_bytes = shm_mb * 1024 * 1024
+        self._context = get_context("spawn")
+        self._procs = [None] * self.workers
+        self._arenas = [None] * self.workers
+        self._requests = [None] * self.workers
+        self._replies = [None] * self.workers
+        self._ready = [None] * self.workers
+        self._locks = [threading.Lock() for _ in range(self.workers)]
+        self._warm_up = False
+
+    def start(self, warm_up=False):
+        self._warm_up = warm_up
+        for index in range(self.workers):
+            self._start_worker(index)
+
+    def _start_worker(self, index):
+        if self._arenas[index] is None:
+            self._arenas[index] = shared_memory.SharedMemory(
+                create=True, size=self.shm_bytes
+            )
+        self._requests[index] = self._context.Queue()
+        self._replies[index] = self._context.Queue()
+        self._ready[index] = self._context.Event()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(
+                index,
+                self.threads,
+                self._arenas[index].name,
+                self._requests[index],
+                self._replies[index],
+                self._ready[index],
+                self._warm_up,
+            ),
+            name=f"inference-worker-{index}",
+            daemon=True,
+        )
+        with _worker_environment(self.threads):
+            process.start()
+        self._procs[index] = process
+
+    def worker_for(self, session_id):
+        """Stable worker index for a session, or None when there is none"""
+        if not session_id:
+            return None
+        return zlib.crc32(str(session_id).encode()) % self.workers
+
+    def is_ready(self):
+        return all(ready is not None and ready.is_set() for ready in self._ready)
+
+    def run(self, index, frames, session_ids, render, sources):
+        """Run one batch on worker index and return (results, proposals)"""
+        with self._locks[index]:
+            arena = _Arena(self._arenas[index])
+            frame_specs = [arena.put(frame) for frame in frames]
+            source_specs = [
+                (
+                    None
+                    if source is None
+                    else (arena.put(source._buffer), source.scale)
+                )
+                for source in sources
+            ]
+            self._requests[index].put((frame_specs, source_specs, session_ids, render))
+
+            while True:
+                try:
+                    status, payload, proposals = self._replies[index].get(
+                        timeout=1.0
+                    )
+                    break
+                except queue.Empty:
+                    if not self._procs[index].is_alive():
+                        print(f"Inference worker {index} exited; restarting it")
+                        self._start_worker(index)
+                        raise RuntimeError(f"Inference worker {index} exited")
+
+        if status == "error":
+            raise RuntimeError(payload)
+        return payload, proposals
+
+    def close(self):
+        for index, requests in enumerate(self._requests):
+            if requests is not None:
+                requests.put(None)
+        for process in self._procs:
+            if process is not None:
+                process.join(timeout=5)
+        for arena in self._arenas:
+            if arena is not None:
+                arena.close()
+                arena.unlink()